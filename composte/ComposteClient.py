@@ -5,6 +5,7 @@ import json
 import shlex
 import subprocess  # nosec
 import traceback
+from contextlib import contextmanager
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
@@ -16,8 +17,9 @@ from network.base.exceptions import GenericError
 from network.base.loggable import StdErr
 from network.client import Client as NetworkClient
 from network.fake.security import Encryption
-from protocol import client, server
+from protocol import client, codec, server
 from util import misc
+from util.pendingRange import PendingRange
 from util.repl import the_worst_repl_you_will_ever_see
 
 DEBUG = False
@@ -27,6 +29,7 @@ class ComposteClient(QtCore.QObject):
     """Client connecting to Composte Servers."""
 
     _updateGUI = QtCore.pyqtSignal(float, float, name="_updateGUI")
+    _resetGUI = QtCore.pyqtSignal(name="_resetGUI")
     _chatToGUI = QtCore.pyqtSignal(str, name="_chatToGUI")
 
     def __init__(
@@ -35,6 +38,7 @@ class ComposteClient(QtCore.QObject):
         broadcast_remote,
         logger,
         encryption_scheme,
+        redraw_interval=16,
         *args,
         **kwargs,
     ):
@@ -46,7 +50,9 @@ class ComposteClient(QtCore.QObject):
         transparently encrypted and encrypted with
         encryption_scheme.encrypt() and decrypted with
         encryption_scheme.decrypt().
-        Broadcasts are handled with broadcast_handler.
+        Broadcasts are handled with broadcast_handler. The editor redraws
+        the score at most once every redraw_interval milliseconds, however
+        many updates arrive in between.
         """
         super(ComposteClient, self).__init__(*args, **kwargs)
 
@@ -58,10 +64,24 @@ class ComposteClient(QtCore.QObject):
             "Connecting to {} and {}".format(interactive_remote, broadcast_remote)
         )
 
+        # Until the handshake says otherwise
+        self.__encoding = codec.JSON
         self.__version_handshake()
 
         self.__project = None
         self.__editor = None
+        self.__redraw_interval = redraw_interval
+
+        # project_id -> operations, while updates are being batched up
+        self.__batch = None
+
+        # The range of the score that the GUI has yet to redraw. The GUI is
+        # only signalled when this goes from empty to not, and picks up
+        # whatever has piled up by the time it gets around to redrawing.
+        self.__pending_gui = PendingRange()
+
+        # cookie -> project_id, so we know which broadcasts to stop listening to
+        self.__subscriptions = {}
 
         self.__tts = False
 
@@ -104,14 +124,39 @@ class ComposteClient(QtCore.QObject):
 
     def __updateGui(self, startOffset, endOffset):
         """Tell the GUI to update the score between startOffset and endOffset."""
-        if self.__editor is not None:
+        if self.__editor is None:
+            return
+
+        if self.__pending_gui.add(startOffset, endOffset):
             self._updateGUI.emit(startOffset, endOffset)
 
-    def __handle_chat_message(self, rpc):
-        rpc["args"][2] = json.loads(rpc["args"][2])
+    def takePendingGuiUpdate(self):
+        """
+        Claim the range of the score that needs redrawing.
+
+        Returns (startOffset, endOffset), covering every update since the last
+        call, or None if there is nothing to redraw.
+        """
+        return self.__pending_gui.take()
 
-        printedStr = rpc["args"][2][0] + ": " + rpc["args"][2][1]
-        spokenStr = shlex.quote(rpc["args"][2][0] + " says " + rpc["args"][2][1])
+    def guiUpdateStats(self):
+        """Count the updates meant for the GUI, and how many it was told about."""
+        stats = self.__pending_gui.stats()
+        return {"received": stats["added"], "signalled": stats["started"]}
+
+    def __resetGui(self):
+        """Tell the GUI to redraw the entire score."""
+        if self.__editor is not None:
+            # Redrawing everything covers anything still pending
+            self.takePendingGuiUpdate()
+            self._resetGUI.emit()
+
+    def __handle_chat_message(self, message):
+        if isinstance(message, str):
+            message = json.loads(message)
+
+        printedStr = message[0] + ": " + message[1]
+        spokenStr = shlex.quote(message[0] + " says " + message[1])
         print(printedStr)
         self._chatToGUI.emit(printedStr)
         if self.__tts and (self.__ttsCommand is not None):
@@ -130,53 +175,120 @@ class ComposteClient(QtCore.QObject):
         def unimplemented(*args):
             return ("?", "?")
 
-        rpc_funs = {"update": self.__do_update}
+        rpc_funs = {
+            "update": self.__apply_update,
+            "update_batch": self.__apply_update_batch,
+        }
 
         rpc = client.deserialize(rpc)
-        if self.__project is None or str(self.__project.projectID) != rpc["args"][0]:
+        if self.__project is None or str(self.__project.project_id) != rpc["args"][0]:
             return
         f = rpc["fName"]
         if rpc["args"][1] == "chat":
-            self.__handle_chat_message(rpc)
+            self.__handle_chat_message(rpc["args"][2])
             return
 
         do_rpc = rpc_funs.get(f, fail)
         try:
-            (status, other) = do_rpc(*rpc["args"])
-            if status == "ok":
-                startOffset, endOffset = other
-                self.__updateGui(startOffset, endOffset)
+            do_rpc(*rpc["args"])
         except Exception as e:
             print(e)
 
+    def __apply_update(self, *args):
+        """Apply a broadcast update unless we have already seen it."""
+        # Broadcasts carry the version of the project after the update
+        (args, version) = (args[:5], int(args[5]))
+        if version <= self.__project.version:
+            # Already caught up on this one with sync
+            return
+
+        (status, other) = self.__do_update(*args)
+        if status == "ok":
+            self.__project.version = version
+            startOffset, endOffset = other
+            self.__updateGui(startOffset, endOffset)
+
+    def __apply_update_batch(self, project_id, operations, version):
+        """Apply the parts of a broadcast batch of updates that we haven't seen."""
+        if isinstance(operations, str):
+            operations = json.loads(operations)
+        version = int(version)
+
+        # Chat messages aren't versioned and never come back from sync, so
+        # there's no telling whether we've seen them. Show them regardless
+        for operation in operations:
+            if operation[0] == "chat":
+                self.__handle_chat_message(operation[1])
+        updates = [operation for operation in operations if operation[0] != "chat"]
+
+        # Every other operation in a broadcast batch bumped the version by one
+        seen = max(0, self.__project.version - (version - len(updates)))
+        if seen >= len(updates):
+            return
+
+        (status, other) = self.__do_update_batch(project_id, updates[seen:])
+        if status == "ok":
+            self.__project.version = version
+            startOffset, endOffset = other
+            self.__updateGui(startOffset, endOffset)
+
     def __do_update(self, *args):
         project = self.project()
 
         try:
-            return util.musicWrapper.performMusicFun(*args, fetchProject=project)
+            return util.musicWrapper.performMusicFun(
+                *args, fetchProject=lambda _: project
+            )
         except Exception:
             print(traceback.format_exc())
             return ("fail", "error")
 
-    def __version_handshake(self):
-        """Perform a version handshake with the remote Composte server."""
-        msg = client.serialize("handshake", misc.get_version())
-        reply = self.__client.send(msg)
+    def __do_update_batch(self, project_id, operations):
+        project = self.project()
+
+        try:
+            return util.musicWrapper.performMusicFunBatch(
+                project_id, operations, fetchProject=lambda _: project
+            )
+        except Exception:
+            print(traceback.format_exc())
+            return ("fail", "error")
+
+    @staticmethod
+    def __native(value):
+        """Undo the stringification of a reply argument, where JSON did it."""
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def __call(self, function_name, *args):
+        """Call a function on the server, and return its deserialized reply."""
+        msg = client.serialize(function_name, *args, encoding=self.__encoding)
+        reply = server.deserialize(self.__client.send(msg))
         if DEBUG:
             print(reply)
-        reply = server.deserialize(reply)
+        return reply
+
+    def __version_handshake(self):
+        """
+        Perform a version handshake with the remote Composte server.
+
+        Also settles on the encoding used for messages from here on.
+        """
+        reply = self.__call("handshake", misc.get_version(), codec.available())
         if reply[0] == "fail":
             status, reason = reply
             version = reason[0]
             raise GenericError(version)
 
+        # Servers that don't know about encodings answer with nothing
+        (encoding,) = reply[1]
+        if encoding in codec.available():
+            self.__encoding = encoding
+
     def register(self, uname, pword, email):
         """Attempt to register a new user's username password email."""
-        msg = client.serialize("register", uname, pword, email)
-        reply = self.__client.send(msg)
-        if DEBUG:
-            print(reply)
-        return server.deserialize(reply)
+        return self.__call("register", uname, pword, email)
 
     # We probably need cookies for login too, otherwise people can request
     # project listings (and thus projects) and subscribe to projects they
@@ -184,12 +296,7 @@ class ComposteClient(QtCore.QObject):
     # for the course, but it is an issue in the long run
     def login(self, uname, pword):
         """Attempt to login with a username and password."""
-        msg = client.serialize("login", uname, pword)
-        reply = self.__client.send(msg)
-        # status, reason = reply
-        if DEBUG:
-            print(reply)
-        return server.deserialize(reply)
+        return self.__call("login", uname, pword)
 
     def create_project(self, uname, pname, metadata):
         """
@@ -202,62 +309,92 @@ class ComposteClient(QtCore.QObject):
         metadata["owner"] = uname
         metadata["name"] = pname
         metadata = json.dumps(metadata)
-        msg = client.serialize("create_project", uname, pname, metadata)
-        reply = self.__client.send(msg)
-        if DEBUG:
-            print(reply)
         try:
-            return server.deserialize(reply)
+            return self.__call("create_project", uname, pname, metadata)
         except Exception:
-            print(reply)
+            print(traceback.format_exc())
             return ("fail", "Mangled reply")
 
     def share(self, project_id, new_contributor):
         """Allow another person to contribute to your project."""
-        msg = client.serialize("share", project_id, new_contributor)
-        reply = self.__client.send(msg)
-        if DEBUG:
-            print(reply)
-        return server.deserialize(reply)
+        return self.__call("share", project_id, new_contributor)
 
     def retrieve_project_listings_for(self, uname):
         """.Get a list of all projects this user is a collaborator on."""
-        msg = client.serialize("list_projects", uname)
-        reply = self.__client.send(msg)
-        return server.deserialize(reply)
+        return self.__call("list_projects", uname)
 
     def get_project(self, project_id):
         """Given a uuid, get the project to work on."""
-        msg = client.serialize("get_project", project_id)
-        reply = server.deserialize(self.__client.send(msg))
-        if DEBUG:
-            print(reply)
+        reply = self.__call("get_project", project_id)
         status, ret = reply
         if status == "ok":
-            print(type(ret))
-            realProj = json.loads(ret[0])
+            realProj = self.__native(ret[0])
             self.__project = util.composteProject.deserializeProject(realProj)
         return reply
 
+    def sync(self, project_id):
+        """
+        Catch up on updates to the current project made since we last saw it.
+
+        Only the missing updates are sent, unless the server has forgotten
+        them, in which case we get the whole project again.
+        """
+        if self.__project is None or str(self.__project.project_id) != project_id:
+            return self.get_project(project_id)
+
+        self.pause_updates()
+        try:
+            reply = self.__call("sync", project_id, self.__project.version)
+            status, ret = reply
+            if status == "ok":
+                delta = self.__native(ret[0])
+                if "project" in delta:
+                    realProj = delta["project"]
+                    self.__project = util.composteProject.deserializeProject(realProj)
+                    self.__resetGui()
+                else:
+                    self.__catch_up(project_id, delta)
+        finally:
+            self.resume_update()
+        return reply
+
+    def __catch_up(self, project_id, delta):
+        """Apply the updates we missed, and redraw whatever they touched."""
+        bounds = None
+        for update in delta["updates"]:
+            (status, other) = self.__do_update(project_id, *update)
+            if status != "ok" or update[0] == "chat":
+                continue
+            if bounds is None:
+                bounds = list(other)
+            else:
+                bounds = [min(bounds[0], other[0]), max(bounds[1], other[1])]
+        self.__project.version = delta["version"]
+
+        if bounds is not None:
+            self.__updateGui(*bounds)
+
     # Realistically, we send a login cookie and the server determines the user
     # from that, but we don't have that yet
     def subscribe(self, uname, project_id):
-        """Subscribe to updates to a project."""
-        msg = client.serialize("subscribe", uname, project_id)
-        reply = self.__client.send(msg)
-        # print(reply)
-        j = json.loads(reply)
-        if DEBUG:
-            print(j[1][0])
-        return server.deserialize(reply)
+        """Subscribe to updates to a project, broadcast in our encoding."""
+        reply = self.__call("subscribe", uname, project_id, self.__encoding)
+        status, ret = reply
+        if status == "ok":
+            self.__subscriptions[ret[0]] = str(project_id)
+            self.__client.subscribe(codec.topic(project_id, self.__encoding))
+        return reply
 
     def unsubscribe(self, cookie):
         """Unsubscribe to updates to a project."""
-        msg = client.serialize("unsubscribe", cookie)
-        reply = self.__client.send(msg)
-        if DEBUG:
-            print(reply)
-        return server.deserialize(reply)
+        reply = self.__call("unsubscribe", cookie)
+        status, _ = reply
+        project_id = self.__subscriptions.pop(cookie, None)
+        if status == "ok" and project_id is not None:
+            # Other subscriptions may still be interested in the same project
+            if project_id not in self.__subscriptions.values():
+                self.__client.unsubscribe(codec.topic(project_id, self.__encoding))
+        return reply
 
     # There's nothing here yet b/c we don't know what anything look like
     def update(self, project_id, fname, args, partIndex=None, offset=None):
@@ -265,13 +402,58 @@ class ComposteClient(QtCore.QObject):
         Send a music related update for the remote backend to process.
 
         args is a tuple of arguments.
+
+        Between begin_batch() and end_batch(), the update is queued up to be
+        sent with the rest of the batch instead.
         """
-        args = json.dumps(args)
-        msg = client.serialize("update", project_id, fname, args, partIndex, offset)
-        reply = self.__client.send(msg)
-        if DEBUG:
-            print(reply)
-        return server.deserialize(reply)
+        args = list(args)
+        if self.__batch is not None:
+            operation = [fname, args, partIndex, offset]
+            self.__batch.setdefault(str(project_id), []).append(operation)
+            return ("ok", ["Queued"])
+
+        return self.__call("update", project_id, fname, args, partIndex, offset)
+
+    def update_batch(self, project_id, operations):
+        """
+        Send many music related updates to be applied in one go.
+
+        operations is a list of [fname, args, partIndex, offset], just as
+        update() would send them.
+        """
+        return self.__call("update_batch", project_id, operations)
+
+    def begin_batch(self):
+        """Start queueing up updates instead of sending them one at a time."""
+        if self.__batch is None:
+            self.__batch = {}
+
+    def end_batch(self):
+        """Send every update queued up since begin_batch(), one batch per project."""
+        (batch, self.__batch) = (self.__batch, None)
+        if batch is None:
+            return ("fail", "Not batching")
+
+        replies = [
+            self.update_batch(project_id, operations)
+            for (project_id, operations) in batch.items()
+        ]
+        return replies[-1] if replies else ("ok", "")
+
+    @contextmanager
+    def batch(self):
+        """
+        Batch up every update made inside a with block.
+
+        with client.batch():
+            client.insertNote(...)
+            client.insertNote(...)
+        """
+        self.begin_batch()
+        try:
+            yield self
+        finally:
+            self.end_batch()
 
     def chat(self, project_id, from_, *message_parts):
         """Send a message in the chat window."""
@@ -401,7 +583,7 @@ class ComposteClient(QtCore.QObject):
         """Launch the editor GUI."""
         if self.__project is not None:
             if self.__editor is None:
-                self.__editor = editor.Editor(self)
+                self.__editor = editor.Editor(self, self.__redraw_interval)
                 self.__editor.showMaximized()
 
         else:
@@ -431,6 +613,7 @@ if __name__ == "__main__":
     parser.add_argument("-b", "--broadcast-port", default=5001, type=int)
     parser.add_argument("-r", "--remote-address", default="composte.me", type=str)
     parser.add_argument("-f", "--file-name", default="", type=str)
+    parser.add_argument("--redraw-interval", default=16, type=int)
 
     args = parser.parse_args()
 
@@ -451,6 +634,7 @@ if __name__ == "__main__":
             "tcp://{}:{}".format(endpoint_addr, bport),
             StdErr,
             Encryption(),
+            args.redraw_interval,
         )
     except GenericError as e:
         print("Version mismatch: Remote server uses version {}".format(str(e)))
@@ -466,9 +650,12 @@ if __name__ == "__main__":
         "list-projects": c.retrieve_project_listings_for,
         "create-project": c.create_project,
         "get-project": c.get_project,
+        "sync": c.sync,
         "subscribe": c.subscribe,
         "unsubscribe": c.unsubscribe,
         "share": c.share,
+        "begin-batch": c.begin_batch,
+        "end-batch": c.end_batch,
         # Music updates
         "change-key-signature": c.changeKeySignature,
         "insert-note": c.insertNote,
@@ -3,8 +3,6 @@
 
 # Things that should probably be a thing:
 # * Login cookies alongside project subscription cookies
-# * Separation of broadcasts per project (regardless of encryption)
-#       Would require moving from single broadcast to some other strategy
 
 import json
 import logging
@@ -12,24 +10,25 @@ import os
 import sqlite3
 import traceback
 import uuid
+import weakref
+from contextlib import ExitStack
 from threading import Lock
 
 from composte.auth import auth
 from composte.conf import logging as networkLog
-from composte.db import driver
+from composte.db import driver, storage
 from composte.network.base.exceptions import GenericError
 from composte.network.base.loggable import Combined, StdErr
 from composte.network.fake.security import Encryption
 from composte.network.server import Server as NetworkServer
-from composte.protocol import client, server
-from composte.util import bookkeeping, composteProject, misc, musicWrapper, timer
+from composte.protocol import client, codec, server
+from composte.util import bookkeeping, composteProject, misc, musicWrapper, oplog, timer
 
 
 class ComposteServer:
     """Class wrapping the composte server."""
 
-    __project_extension = ".heap"
-    __metadata_extension = ".meta"
+    __database = "data/composte.db"
 
     # I'm so sorry
     __register_lock = Lock()
@@ -41,6 +40,15 @@ class ComposteServer:
         logger,
         encryption_scheme,
         data_root="data/",
+        workers=4,
+        flush_interval=30,
+        max_dirty_age=300,
+        fsync_interval=1,
+        max_projects=256,
+        max_project_bytes=None,
+        hash_workers=2,
+        storage_backend="file",
+        db_cache_ttl=60,
     ):
         """
         Initialize a Composte Server.
@@ -51,18 +59,29 @@ class ComposteServer:
         - Transparently encrypts with encryption_scheme.encrypt()
         - Transparently decrypts encryption_scheme.decrypt()
         - Stores data in the directory data_root.
+        - Handles up to workers requests at a time.
+        - Checks for unsaved projects every flush_interval seconds, and writes
+          out those that have been unsaved for at least max_dirty_age seconds.
+        - Logs every update as it is applied, and makes sure that the log is on
+          disk at least every fsync_interval seconds.
+        - Keeps at most max_projects projects, or an estimated
+          max_project_bytes bytes of projects, in memory when they are not
+          being used.
+        - Hashes and verifies passwords on hash_workers separate processes.
+        - Keeps snapshots of projects as loose files if storage_backend is
+          "file", or in the database if it is "sqlite".
+        - Trusts cached lookups of users, projects and contributors for up to
+          db_cache_ttl seconds.
         """
         self.__server = NetworkServer(
             interactive_port, broadcast_port, logger, encryption_scheme
         )
 
-        self.__server.start_background(
-            self.__handle, self.__preprocess, self.__postprocess
-        )
-
         self.__users = None
         self.__projects = None
         self.__contributors = None
+        self.__db_lock = Lock()
+        self.__db_cache_ttl = db_cache_ttl
 
         self.version = misc.get_version()
         self.__server.info("Composte server version {}".format(self.version))
@@ -70,33 +89,131 @@ class ComposteServer:
         self.__data_root = data_root
         self.__project_root = os.path.join(self.__data_root, "users")
 
+        self.get_db_connections()
+
+        if storage_backend == "sqlite":
+            self.__storage = storage.SQLiteStorage(ComposteServer.__database)
+        else:
+            self.__storage = storage.FileStorage(self.__project_root, self.__projects)
+
+        # Snapshots of projects are only written every so often, and updates
+        # applied since the last snapshot live here in the meantime
+        self.__oplog = oplog.OperationLog(os.path.join(self.__data_root, "oplog"))
+
         self.__dlock = Lock()
         self.__done = False
 
-        self.__pool = bookkeeping.ProjectPool()
-        # A better solution would have a lock for every project, but in a
-        # classroom demo this won't be an issue
-        self.__flushing = Lock()
+        self.__pool = bookkeeping.ProjectPool(
+            max_projects,
+            max_project_bytes,
+            sizeof=lambda project: project.approximateSize(),
+        )
+        # Updates and flushes of a project are serialized by that project's
+        # lock, and never wait on other projects
+        self.__project_locks = bookkeeping.LockPool()
+
+        # project -> (version, serialized project), so that collaborators
+        # opening an unchanged project don't each pay to serialize it. Entries
+        # go away along with the projects they belong to.
+        self.__wire_cache = weakref.WeakKeyDictionary()
+        self.__wire_cache_lock = Lock()
+        self.__wire_cache_hits = 0
+        self.__wire_cache_misses = 0
 
         def is_done(self):
             with self.__dlock:
                 return not self.__done
 
         self.__timer = timer.every(
-            300, 2, lambda: self.__pool.map(self.flush_project), lambda: is_done(self)
+            flush_interval,
+            2,
+            lambda: self.__flush_and_evict(max_dirty_age),
+            lambda: is_done(self),
+        )
+        self.__sync_timer = timer.every(
+            fsync_interval, fsync_interval, self.__oplog.sync, lambda: is_done(self)
         )
 
-        try:
-            os.makedirs(self.__project_root)
-        except FileExistsError:
-            pass
+        self.__hasher = auth.Hasher(hash_workers)
 
         self.sessions = {}
+        # project_id -> {encoding: number of subscribers using it}, so that
+        # broadcasts only go out in the encodings that someone will read
+        self.__listeners = {}
+        self.__listeners_lock = Lock()
 
-    def flush_project(self, project, count):
-        """Flush project to backend storage."""
-        with self.__flushing:
-            self.write_project(project)
+        # Workers handle requests as soon as they start, so they come last.
+        # Each gets its own database connection.
+        self.__server.start_background(
+            self.__handle, self.__preprocess, self.__postprocess, workers=workers
+        )
+
+    def flush_project(self, project, count=0):
+        """
+        Flush project to backend storage if it has unsaved changes.
+
+        This folds the operation log of the project into a new snapshot.
+        """
+        self.flush_projects([project])
+
+    def flush_projects(self, projects):
+        """
+        Flush those of projects that have unsaved changes, all in one write.
+
+        Updates to every one of them wait until the write is done.
+        """
+        projects = {str(project.project_id): project for project in projects}
+        with ExitStack() as stack:
+            # Always taken in the same order, so flushes can't deadlock
+            for pid in sorted(projects):
+                stack.enter_context(self.__project_locks.get(pid))
+
+            dirty = [
+                project
+                for (pid, project) in projects.items()
+                if self.__pool.is_dirty(pid)
+            ]
+            if not dirty:
+                return
+            self.write_projects(dirty)
+            for project in dirty:
+                self.__pool.mark_clean(str(project.project_id))
+
+    def __flush_dirty(self, max_dirty_age=0):
+        """Flush every project that has been dirty for at least max_dirty_age."""
+        dirty = []
+        self.__pool.map_dirty(
+            lambda project, count: dirty.append(project), max_dirty_age
+        )
+        self.flush_projects(dirty)
+
+    def __flush_and_evict(self, max_dirty_age):
+        """Write out projects that have been dirty for a while, then trim the pool."""
+        self.__flush_dirty(max_dirty_age)
+        self.__pool.evict(self.flush_project)
+        self.__server.debug("Project pool: {}".format(self.__pool.stats()))
+
+    def stats(self):
+        """Report statistics about the server's caches."""
+        with self.__wire_cache_lock:
+            wire_cache = {
+                "projects": len(self.__wire_cache),
+                "hits": self.__wire_cache_hits,
+                "misses": self.__wire_cache_misses,
+            }
+        return (
+            "ok",
+            {
+                "pool": self.__pool.stats(),
+                "wire": wire_cache,
+                "hasher": self.__hasher.stats(),
+                "db": {
+                    "auth": self.__users.cache_stats(),
+                    "projects": self.__projects.cache_stats(),
+                    "contributors": self.__contributors.cache_stats(),
+                },
+            },
+        )
 
     # Database interactions
 
@@ -106,7 +223,7 @@ class ComposteServer:
 
         Username must be unique per user database.
         """
-        hash_ = auth.hash(pword)
+        hash_ = self.__hasher.hash(pword)
 
         with ComposteServer.__register_lock:
             hopefully_None = self.__users.get(uname)
@@ -121,11 +238,6 @@ class ComposteServer:
             except sqlite3.DatabaseError:
                 return ("fail", "Generic failure")
 
-        try:
-            os.mkdir(os.path.join(self.__project_root, uname))
-        except FileExistsError:
-            pass
-
         return ("ok", "")
 
     def login(self, uname, pword):
@@ -134,11 +246,11 @@ class ComposteServer:
         if record.hash is None:
             return ("fail", "failed to login")
 
-        success = auth.verify(pword, record.hash)
+        success = self.__hasher.verify(pword, record.hash)
         if success:
             uuids = self.__contributors.get_projects(uname)
             project_ids = [str(uuid_) for uuid_ in uuids]
-            return ("ok", json.dumps(project_ids))
+            return ("ok", project_ids)
         else:
             return ("fail", "failed to login")
 
@@ -148,19 +260,18 @@ class ComposteServer:
 
         Projects are given unique identifiers, so project names need not be unique.
         """
-        metadata = json.loads(metadata)
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
         metadata["name"] = pname
         metadata["owner"] = uname
 
         proj = composteProject.ComposteProject(metadata)
-        id_ = str(proj.projectID)
+        id_ = str(proj.project_id)
 
         hopefully_not_None = self.__users.get(uname)
         if hopefully_not_None is None:
             return ("fail", "User {} is not registered".format(uname))
 
-        self.write_project(proj)
-
         self.__server.info(
             "Creating project {} with name {} for {}".format(
                 id_, metadata["name"], uname
@@ -173,8 +284,7 @@ class ComposteServer:
             self.__server.info("?????????????")
             raise GenericError("The database is borked")
 
-        p = self.__projects.get(id_)
-        print(p)
+        self.write_project(proj)
 
         # This could then potentially also lock the database...
         try:
@@ -189,15 +299,28 @@ class ComposteServer:
         """
         Retrieve the serialized form of a project for transmission.
 
-        Currently only used during the initial handshake.
+        Currently only used during the initial handshake. The serialized form
+        is reused until the project is next updated.
         """
-        proj = self.__pool.put(pid, lambda: self.get_project(pid)[1])
-        self.__pool.remove(pid)
+        with self.__project_locks.get(pid):
+            proj = self.__pool.put(pid, lambda: self.__load_project(pid))
+            self.__pool.remove(pid)
 
-        if type(proj) == str:
-            return ("fail", "What even is that")
+            if proj is None:
+                return ("fail", "What even is that")
 
-        return ("ok", json.dumps(proj.serialize()))
+            with self.__wire_cache_lock:
+                (version, serialized) = self.__wire_cache.get(proj, (None, None))
+                if version == proj.version:
+                    self.__wire_cache_hits += 1
+                    return ("ok", serialized)
+                self.__wire_cache_misses += 1
+
+            serialized = list(proj.serialize())
+            with self.__wire_cache_lock:
+                self.__wire_cache[proj] = (proj.version, serialized)
+
+        return ("ok", serialized)
 
     def get_project(self, pid):
         """
@@ -215,93 +338,96 @@ class ComposteServer:
 
         return ("ok", proj)
 
+    def __load_project(self, pid):
+        """Fetch a project for the project pool, or None if there isn't one."""
+        (status, proj) = self.get_project(pid)
+        if status != "ok":
+            return None
+        return proj
+
     def list_projects_by_user(self, uname):
         """Retrieve a list of projects that a user is a collaborator on."""
         listings = self.__contributors.get(username=uname)
         listings = [str(project) for project in listings]
-        return ("ok", json.dumps(listings))
+        return ("ok", listings)
 
     def list_contributors_of_project(self, pid):
         """Retrieve a list of a project's contributors."""
         listings = self.__contributors.get(project_id=pid)
         listings = [str(user) for user in listings]
-        return ("ok", json.dumps(listings))
+        return ("ok", listings)
+
+    def compare_versions(self, client_version, encodings="[]"):
+        """
+        Compare version hashes, and settle on an encoding for messages.
+
+        encodings lists the encodings the client can speak, most preferred
+        first. On success, the reply names the one to use.
+        """
+        if isinstance(encodings, str):
+            encodings = json.loads(encodings)
 
-    def compare_versions(self, client_version):
-        """Compare version hashes."""
         if client_version != self.version:
             status = "fail"
             response = (status, self.version)
         else:
             status = "ok"
-            reason = ""
-            response = (status, reason)
+            response = (status, codec.negotiate(encodings))
 
         return response
 
     # Utility
 
     def write_project(self, project):
-        """
-        I'm going to cheat for now and dump to the filesystem.
+        """Write out a snapshot of a project."""
+        self.write_projects([project])
 
-        Ideally we write to a database, but that requires more work. Either way,
-        that can be hidden in this function.
+    def write_projects(self, projects):
         """
-        user = project.metadata["owner"]
-        id_ = str(project.projectID)
+        Write out snapshots of projects.
 
-        (metadata, parts, _) = project.serialize()
-
-        base_path = os.path.join(self.__project_root, user)
-        base_path = os.path.join(base_path, id_)
-        with open(base_path + self.__metadata_extension, "w") as f:
-            f.write(metadata)
-
-        with open(base_path + self.__project_extension, "w") as f:
-            f.write(parts)
-
-    def read_project(self, pid):
+        Where they are kept is up to the storage backend, which only writes
+        out the parts that changed since they were last stored. Logged updates
+        that the snapshots already contain are dropped afterwards.
         """
-        We've cheated and the projects live on the filesystem.
+        self.__storage.write(projects)
+        for project in projects:
+            self.__oplog.compact(str(project.project_id), project.version)
 
-        Ideally we want them in a database, but that's work. Either way, we
-        hide the true locations of projects inside of this function.
-        """
-        owner = self.__projects.get(pid).owner
-
-        filename = pid + self.__metadata_extension
-        relpath = os.path.join(owner, filename)
-        fullpath = os.path.join(self.__project_root, relpath)
-        with open(fullpath, "r") as f:
-            metadata = f.read()
-
-        filename = pid + self.__project_extension
-        relpath = os.path.join(owner, filename)
-        fullpath = os.path.join(self.__project_root, relpath)
-        with open(fullpath, "r") as f:
-            parts = f.read()
+    def read_project(self, pid):
+        """Load the last snapshot of a project, then replay updates made since."""
+        # Hold the project lock so that a flush can't compact the log between
+        # us reading the snapshot and reading the log
+        with self.__project_locks.get(pid):
+            project = self.__storage.read(pid)
+
+            # Catch up on updates applied since the snapshot was taken
+            replayed = self.__oplog.read(pid, since=project.version)
+            for (version, op) in replayed:
+                musicWrapper.performMusicFun(pid, *op, fetchProject=lambda _: project)
+                project.version = version
+            if replayed:
+                self.__pool.mark_dirty(pid)
 
-        project = composteProject.deserializeProject((metadata, parts, pid))
         # Don't put it into the pool yet, because then we end up with a
         # use count that will never be 0 again
         return project
 
     # Cookie: uuid
-    def generate_cookie_for(self, user, project):
+    def generate_cookie_for(self, user, project, encoding=codec.JSON):
         """We don't bother checking for UUID collisions, since they "don't" happen."""
         cookie = uuid.uuid4()
-        self.sessions[cookie] = (user, project)
+        self.sessions[cookie] = (user, project, encoding)
         return cookie
 
-    # Session: {user, project_id}
+    # Session: {user, project_id, encoding of broadcasts}
     # May need login cookies too
     def cookie_to_session(self, cookie):
         """Retrieve the session associated with a cookie."""
         try:
             cookie = uuid.UUID(cookie)
         except ValueError:
-            return ("fail", "That doesn't look like a cookie")
+            return None
 
         try:
             session = self.sessions[cookie]
@@ -328,47 +454,174 @@ class ComposteServer:
         Perform a music-related update.
 
         Defer to musicWrapper.performMusicFun
-        """
-        # Use this function to get a project
-        pid_ = None
 
-        def get_fun(pid):
-            """Fetch a project from the cache."""
+        Successful updates are broadcast to the project's subscribers along
+        with the version of the project they produced. Broadcasting under the
+        project lock keeps broadcasts in the order the updates were applied.
+        """
+        (pid, *_) = args
+        with self.__project_locks.get(pid):
             # The client musicfuns shouldn't have to worry about how the
             # server manages the lifetimes of project objects
-            proj = self.__pool.put(pid, lambda: self.get_project(pid)[1])
-            # We need to steal the pid to release it later
-            return proj
-
-        with self.__flushing:
+            project = self.__pool.put(pid, lambda: self.__load_project(pid))
+            if project is None:
+                return ("fail", "Project not found")
             try:
-                # We still need to provide a way to get the project
-                reply = musicWrapper.performMusicFun(*args, fetchProject=get_fun)
+                reply = musicWrapper.performMusicFun(
+                    *args, fetchProject=lambda _: project
+                )
             except Exception:
                 print(traceback.format_exc())
                 return ("fail", "Internal Server Error")
+            else:
+                # Before the pool lets go of it, so it can't be evicted unflushed
+                if reply[0] == "ok":
+                    self.__record_update(pid, project, list(args[1:]))
+            finally:
+                self.__pool.remove(pid)
+
+            if reply[0] == "ok":
+                self.__broadcast(pid, "update", *args, project.version)
+            return reply
+
+    def do_update_batch(self, pid, operations):
+        """
+        Perform a batch of music-related updates in one go.
+
+        operations is a list, or a JSON encoded list, of [fname, args,
+        partIndex, offset], each exactly as it would be sent in an update.
+        The whole batch is applied under one acquisition of the project lock,
+        and the operations that were applied go out in a single broadcast,
+        along with the version of the project after the last of them. Chat
+        messages are broadcast too, but don't bump the version.
+
+        The batch stops at the first operation that fails.
+        """
+        if isinstance(operations, str):
+            operations = json.loads(operations)
+        applied = []
+
+        def record(operation):
+            self.__record_update(pid, project, operation)
+            applied.append(operation)
+
+        with self.__project_locks.get(pid):
+            project = self.__pool.put(pid, lambda: self.__load_project(pid))
+            if project is None:
+                return ("fail", "Project not found")
+            try:
+                reply = musicWrapper.performMusicFunBatch(
+                    pid, operations, fetchProject=lambda _: project, onApplied=record
+                )
+            except Exception as e:
+                self.__server.error(traceback.format_exc())
+                # Whatever was applied before the failure still goes out
+                reply = (
+                    "fail",
+                    "Internal Server Error after {} of {} operations: {}".format(
+                        len(applied), len(operations), str(e) or type(e).__name__
+                    ),
+                )
+            finally:
+                self.__pool.remove(pid)
+
+            if applied:
+                self.__broadcast(pid, "update_batch", pid, applied, project.version)
             return reply
 
-            # We can't decrement the refcount before now, because we could
-            # cause an early flush otherwise, and then serverside persistence
-            # is breaks.
-            self.__pool.remove(pid_, self.write_project)
+    def __broadcast(self, pid, function_name, *args):
+        """
+        Broadcast an update to the subscribers of a project.
+
+        It goes out once in every encoding that subscribers to the project
+        use, each under its own topic. The caller must hold the project lock.
+        """
+        with self.__listeners_lock:
+            encodings = list(self.__listeners.get(pid, {}))
+
+        for encoding in encodings:
+            self.__server.broadcast(
+                client.serialize(function_name, *args, encoding=encoding),
+                topic=codec.topic(pid, encoding),
+            )
+
+    def __listen(self, pid, encoding, count):
+        """Count subscribers to a project that read broadcasts in an encoding."""
+        with self.__listeners_lock:
+            listeners = self.__listeners.setdefault(pid, {})
+            listeners[encoding] = listeners.get(encoding, 0) + count
+            if listeners[encoding] <= 0:
+                del listeners[encoding]
+            if not listeners:
+                del self.__listeners[pid]
+
+    def __record_update(self, pid, project, operation):
+        """
+        Account for an update that has been applied to a project.
+
+        The caller must hold the project lock.
+        """
+        # Chat messages don't change the project
+        if operation[0] == "chat":
+            return
+
+        with self.__wire_cache_lock:
+            self.__wire_cache.pop(project, None)
+        project.version += 1
+        self.__oplog.append(pid, project.version, operation)
+        self.__pool.mark_dirty(pid)
+
+    def sync(self, pid, since_version):
+        """
+        Bring a client's copy of a project up to date.
 
-    def subscribe(self, username, pid):
+        Replies with the updates applied since since_version, as long as they
+        are all still in the operation log. Otherwise, replies with the whole
+        project.
+        """
+        since = int(since_version)
+
+        with self.__project_locks.get(pid):
+            proj = self.__pool.put(pid, lambda: self.__load_project(pid))
+            self.__pool.remove(pid)
+
+            if proj is None:
+                return ("fail", "What even is that")
+
+            updates = self.__oplog.read(pid, since=since)
+            versions = [version for (version, _) in updates]
+            if versions == list(range(since + 1, proj.version + 1)):
+                delta = {
+                    "version": proj.version,
+                    "updates": [op for (_, op) in updates],
+                }
+                return ("ok", delta)
+
+            # The history has been compacted away, so start over
+            (status, serialized) = self.get_project_over_the_wire(pid)
+            if status != "ok":
+                return (status, serialized)
+            return ("ok", {"version": proj.version, "project": serialized})
+
+    def subscribe(self, username, pid, encoding=codec.JSON):
         """
         Subscribe a client to updates for a project.
 
-        Pins the project in the cache
+        Pins the project in the cache. Updates are broadcast to the client in
+        encoding, under the topic codec.topic(pid, encoding).
         """
+        if encoding not in codec.available():
+            return ("fail", "Unknown encoding {}".format(encoding))
+
         # Assert permission
-        contributors = self.__contributors.get(project_id=pid)
-        contributors = [user.uname for user in contributors]
-        if username in contributors:
-            self.__pool.put(pid, lambda: self.get_project(pid)[1])
-            cookie = self.generate_cookie_for(username, pid)
+        if self.__contributors.is_contributor(username, pid):
+            if self.__pool.put(pid, lambda: self.__load_project(pid)) is None:
+                return ("fail", "Project not found")
+            cookie = self.generate_cookie_for(username, pid, encoding)
+            self.__listen(pid, encoding, 1)
             return ("ok", str(cookie))
         else:
-            self.__server.debug("{} is not one of {}".format(username, contributors))
+            self.__server.debug("{} is not a contributor to {}".format(username, pid))
             return ("fail", "You are not a contributor")
 
     def unsubscribe(self, cookie):
@@ -382,33 +635,35 @@ class ComposteServer:
         if session is None:
             return ("fail", "You are not subscribed")
 
-        (user, project_id) = session
+        (user, project_id, encoding) = session
         (status, reason) = self.remove_cookie(cookie)
 
         if status == "ok":
-            project = self.__pool.put(project_id, lambda x: self.get_project(x)[1])
-            pid = project.projectID
-            self.__pool.remove(pid, lambda x: self.write_project(x))
+            self.__listen(project_id, encoding, -1)
+            self.__pool.remove(project_id, self.flush_project)
 
         return (status, reason)
 
     # Packaged for neatness
     def get_db_connections(self):
         """Open database connections if they are not already open."""
-        dbname = "data/composte.db"
+        dbname = ComposteServer.__database
+        ttl = self.__db_cache_ttl
 
-        if self.__users is None:
-            self.__users = driver.Auth(dbname)
+        with self.__db_lock:
+            if self.__users is None:
+                schema = driver.get_manager(dbname).migrate()
+                self.__server.info("Database schema version {}".format(schema))
+                self.__users = driver.Auth(dbname, ttl)
 
-        if self.__projects is None:
-            self.__projects = driver.Projects(dbname)
+            if self.__projects is None:
+                self.__projects = driver.Projects(dbname, ttl)
 
-        if self.__contributors is None:
-            self.__contributors = driver.Contributors(dbname)
+            if self.__contributors is None:
+                self.__contributors = driver.Contributors(dbname, ttl)
 
     def share(self, pid, new_contributor):
         """Add a new user to the list of contributors to a project."""
-        contributors = self.__contributors.get(project_id=pid)
         user = self.__users.get(new_contributor)
 
         # If that's not a known user, fail
@@ -416,7 +671,7 @@ class ComposteServer:
             return ("fail", "Who is that")
 
         # If they are already a contributor, nothing to do
-        if new_contributor not in contributors:
+        if not self.__contributors.is_contributor(new_contributor, pid):
             # If that's not a valid project, fail
             try:
                 self.__contributors.put(new_contributor, pid)
@@ -429,7 +684,6 @@ class ComposteServer:
 
     def __handle(self, _, rpc):
         """Dispatch to handle messages."""
-        self.get_db_connections()
 
         def fail(*args):
             return ("fail", "I don't know what you want me to do")
@@ -446,8 +700,11 @@ class ComposteServer:
             "subscribe": self.subscribe,
             "unsubscribe": self.unsubscribe,
             "update": self.do_update,
+            "update_batch": self.do_update_batch,
+            "sync": self.sync,
             "handshake": self.compare_versions,
             "share": self.share,
+            "stats": self.stats,
         }
 
         self.__server.debug(rpc)
@@ -459,24 +716,24 @@ class ComposteServer:
             # This is expected to be a tuple of things to send back
             (status, other) = do_rpc(*rpc["args"])
         except GenericError:
-            return ("fail", "Internal server error")
+            (status, other) = ("fail", "Internal server error")
         except Exception:
             self.__server.error(traceback.format_exc())
-            return ("fail", "Internal server error (Developer error)")
-
-        # Only broadcast successful updates
-        if f == "update" and status == "ok":
-            self.__server.broadcast(client.serialize(rpc["fName"], *rpc["args"]))
+            (status, other) = ("fail", "Internal server error (Developer error)")
 
-        return (status, other)
+        # Reply in the encoding we were asked in
+        return (rpc["encoding"], status, other)
 
     def __preprocess(self, message):
         """Deserialize messages for consumption by __handle."""
-        return client.deserialize(message)
+        rpc = client.deserialize(message)
+        rpc["encoding"] = codec.detect(message)
+        return rpc
 
     def __postprocess(self, reply):
         """Serialize replies to be sent over the wire."""
-        reply_str = server.serialize(*reply)
+        (encoding, *reply) = reply
+        reply_str = server.serialize(*reply, encoding=encoding)
         self.__server.debug(reply_str)
         return reply_str
 
@@ -487,9 +744,14 @@ class ComposteServer:
             self.__done = True
 
         self.__timer.join()
-        self.__pool.map(self.flush_project)
+        self.__sync_timer.join()
+        self.__flush_dirty()
+        self.__oplog.close()
 
         self.__server.stop()
+        self.__hasher.shutdown()
+        self.__storage.close()
+        driver.get_manager(ComposteServer.__database).close()
 
 
 def stop_server(sig, frame, server):
@@ -508,6 +770,15 @@ if __name__ == "__main__":
 
     parser.add_argument("-i", "--interactive-port", default=5000, type=int)
     parser.add_argument("-b", "--broadcast-port", default=5001, type=int)
+    parser.add_argument("--flush-interval", default=30, type=float)
+    parser.add_argument("--max-dirty-age", default=300, type=float)
+    parser.add_argument("--fsync-interval", default=1, type=float)
+    parser.add_argument("--max-projects", default=256, type=int)
+    parser.add_argument("--max-project-bytes", default=None, type=int)
+    parser.add_argument("-w", "--workers", default=4, type=int)
+    parser.add_argument("--hash-workers", default=2, type=int)
+    parser.add_argument("--storage", default="file", choices=["file", "sqlite"])
+    parser.add_argument("--db-cache-ttl", default=60, type=float)
 
     args = parser.parse_args()
 
@@ -523,6 +794,15 @@ if __name__ == "__main__":
         "tcp://*:{}".format(args.broadcast_port),
         real_log,
         Encryption(),
+        workers=args.workers,
+        flush_interval=args.flush_interval,
+        max_dirty_age=args.max_dirty_age,
+        fsync_interval=args.fsync_interval,
+        max_projects=args.max_projects,
+        max_project_bytes=args.max_project_bytes,
+        hash_workers=args.hash_workers,
+        storage_backend=args.storage,
+        db_cache_ttl=args.db_cache_ttl,
     )
 
     signal.signal(signal.SIGINT, lambda sig, f: stop_server(sig, f, s))
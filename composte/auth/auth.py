@@ -1,4 +1,9 @@
 """Authentication helpers."""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+
 from passlib.hash import pbkdf2_sha256
 
 
@@ -12,3 +17,90 @@ def hash(hashable):
 def verify(candidate, record):
     """Verify candidate against record."""
     return pbkdf2_sha256.verify(candidate, record)
+
+
+class Hasher:
+    """
+    Hash and verify passwords on a pool of worker processes.
+
+    pbkdf2 is deliberately slow, so hashing in the calling thread would hold
+    up everything else that thread could be doing. Callers of hash and verify
+    still wait for their own result, but the work happens in one of workers
+    processes, leaving the calling process free to serve other requests.
+
+    At most max_pending jobs are queued or running at once; beyond that,
+    callers wait for a slot before their job is submitted. With workers=0,
+    jobs run in the calling thread instead, as they always used to.
+    """
+
+    def __init__(self, workers=2, max_pending=None):
+        """Initialize a hasher with a pool of workers processes."""
+        if max_pending is None:
+            max_pending = 4 * max(workers, 1)
+
+        self.__executor = None
+        if workers > 0:
+            # Forking a process with running threads is asking for trouble
+            self.__executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        self.__slots = BoundedSemaphore(max_pending)
+
+        self.__lock = Lock()
+        self.__workers = workers
+        self.__pending = 0
+        self.__max_pending = 0
+        self.__jobs = 0
+        self.__total_latency = 0.0
+        self.__max_latency = 0.0
+
+    def __run(self, fun, *args):
+        start = time.monotonic()
+        with self.__lock:
+            self.__pending += 1
+            self.__max_pending = max(self.__max_pending, self.__pending)
+
+        try:
+            with self.__slots:
+                if self.__executor is None:
+                    return fun(*args)
+                return self.__executor.submit(fun, *args).result()
+        finally:
+            latency = time.monotonic() - start
+            with self.__lock:
+                self.__pending -= 1
+                self.__jobs += 1
+                self.__total_latency += latency
+                self.__max_latency = max(self.__max_latency, latency)
+
+    def hash(self, hashable):
+        """Create a hash."""
+        return self.__run(hash, hashable)
+
+    def verify(self, candidate, record):
+        """Verify candidate against record."""
+        return self.__run(verify, candidate, record)
+
+    def stats(self):
+        """
+        Report how busy the hasher is.
+
+        pending counts jobs that are queued or running right now, and latency
+        is measured from the moment a job is asked for until its result is in.
+        """
+        with self.__lock:
+            return {
+                "workers": self.__workers,
+                "pending": self.__pending,
+                "max_pending": self.__max_pending,
+                "jobs": self.__jobs,
+                "mean_latency": self.__total_latency / self.__jobs
+                if self.__jobs
+                else 0.0,
+                "max_latency": self.__max_latency,
+            }
+
+    def shutdown(self):
+        """Wait for outstanding jobs, then stop the worker processes."""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
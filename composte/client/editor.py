@@ -1,6 +1,6 @@
 """GUI editor for composte."""
 import music21
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt
 
 import ComposteClient
@@ -32,37 +32,70 @@ class Editor(QtWidgets.QMainWindow):
     __defaultTimeSignature = UITimeSignature.UITimeSignature(4, 4)
     __defaultKeySignature = UIKeySignature.C()
 
-    def __init__(self, client: ComposteClient.ComposteClient, *args, **kwargs):
+    def __init__(
+        self,
+        client: ComposteClient.ComposteClient,
+        redrawInterval: int = 16,
+        *args,
+        **kwargs,
+    ):
         """
         Start a new editor, working on the projected loaded by client.
 
         :param client: a Composte client, which manages updates to the project.
+        :param redrawInterval: Least number of milliseconds between redraws
+            prompted by updates. Updates arriving in the meantime are redrawn
+            together.
         """
         super(Editor, self).__init__(*args, **kwargs)
         self.__client = client
+        self.__redraws = 0
+
+        self.__redrawTimer = QtCore.QTimer(self)
+        self.__redrawTimer.setSingleShot(True)
+        self.__redrawTimer.setInterval(redrawInterval)
+        self.__redrawTimer.timeout.connect(self.__redrawPending)
+
         self.__makeUI()
         self.__resetAll()
-        self.__client._updateGUI.connect(self.update)
+        self.__client._updateGUI.connect(self.__scheduleRedraw)
+        self.__client._resetGUI.connect(self.__resetAll)
         self.__client._chatToGUI.connect(self.printChatMessage)
 
     def update(self, startOffset: float, endOffset: float):
         """
         Update a section of the score on the UI from the copy held by the client.
 
-        :note: Updating sections is not currently supported; all updates redraw
-        the entire score.
+        Only the measures overlapping the section are redrawn.
 
         :param startOffset: First quarter-note offset to be updated.  If None,
             update from start of project.
         :param startOffset: Quarter-note offset after the last one to be
             updated.  If None, update through end of project.
         """
-        # FIXME: Updating of specific sections not working quite yet.
+        self.__redraws += 1
         try:
-            self.__ui_scoreViewport.update(self.__client.project(), None, None)
+            self.__ui_scoreViewport.update(
+                self.__client.project(), startOffset, endOffset
+            )
         except ValueError as e:
             self.__debugConsoleWrite(str(e))
 
+    def __scheduleRedraw(self, startOffset: float, endOffset: float):
+        """Redraw the parts of the score that changed, once the timer runs out."""
+        if not self.__redrawTimer.isActive():
+            self.__redrawTimer.start()
+
+    def __redrawPending(self):
+        """Redraw everything that changed since the last redraw."""
+        pending = self.__client.takePendingGuiUpdate()
+        if pending is not None:
+            self.update(*pending)
+
+    def redrawStats(self):
+        """Count updates received by the client, and redraws that came of them."""
+        return {**self.__client.guiUpdateStats(), "redraws": self.__redraws}
+
     def __resetAll(self):
         """Reload the entire project from the Composte client and redraw everything."""
         self.update(None, None)
@@ -216,7 +249,7 @@ class Editor(QtWidgets.QMainWindow):
             piece at which the note should be inserted.
         """
         self.__client.insertNote(
-            self.__client.project().projectID,
+            str(self.__client.project().project_id),
             offset,
             partIdx,
             str(pitch),
@@ -235,7 +268,7 @@ class Editor(QtWidgets.QMainWindow):
             piece of the note to be removed.
         """
         self.__client.removeNote(
-            self.__client.project().projectID, offset, partIdx, str(pitch)
+            str(self.__client.project().project_id), offset, partIdx, str(pitch)
         )
 
     def __handleChatMessage(self, name, msg):
@@ -245,7 +278,7 @@ class Editor(QtWidgets.QMainWindow):
         :param name: The username to be displayed with the message.
         :param msg: The message to be broadcast.
         """
-        self.__client.chat(self.__client.project().projectID, name, msg)
+        self.__client.chat(str(self.__client.project().project_id), name, msg)
 
     def __handleTTSon(self):
         """Tell the Composte client to enable text-to-speech, if available."""
@@ -17,6 +17,10 @@ class UIKeySignature(QtWidgets.QGraphicsItem):
         self.__sharps = sharps
         self.__flats = flats
 
+    def __eq__(self, keysig):
+        """Compare key signatures for equality."""
+        return self.__sharps == keysig.__sharps and self.__flats == keysig.__flats
+
     def accidentalMarkOf(self, pitch: music21.pitch.Pitch):
         """Given a pitch, return what accidental mark should be displayed for it."""
         sharps = self.__sharps
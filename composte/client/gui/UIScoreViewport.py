@@ -1,4 +1,5 @@
 """Viewport for the entire score."""
+from bisect import bisect_right
 from typing import Optional, Tuple
 
 import music21
@@ -42,12 +43,17 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
 
         self.__measures = []
         self.__lines = []
+        # What the measures were laid out for, see __layoutOf
+        self.__layout = None
+        # __starts[i] is the offset at which measure i begins, for as many
+        # measures as are known to have the right length. See __ensureStarts.
+        self.__starts = [0.0]
 
         self.__scoreScene = QtWidgets.QGraphicsScene(parent=self)
         self.__scoreScene.setBackgroundBrush(QtGui.QBrush(UISet.BG_COLOR))
         self.setScene(self.__scoreScene)
 
-    def update(self, project, startOffset: float, endOffset: float) -> None:  # noqa
+    def update(self, project, startOffset: float, endOffset: float) -> None:
         """
         Update the region of the score between startOffset and endOffset.
 
@@ -55,8 +61,9 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
         update through the end. If both are None, update the entire score,
         including updating the number of parts.
 
-        :note: Updating sections is not currently supported; all updates redraw
-        the entire score.
+        Only the measures overlapping the region are cleared and refilled,
+        unless the number of parts or the time signatures have changed, which
+        moves every measure and so redraws the entire score anyway.
 
         :param project: ComposteProject to draw from.
         :param startOffset: First quarter-note offset to be updated.  If None,
@@ -65,72 +72,174 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
             updated.  If None, update through end of project.
         """
         if startOffset is None and endOffset is None:
-            self.clear()
-            for part in project.parts:
-                cl = UIClef.fromMusic21(part.getClefs()[0])
-                ks = UIKeySignature.fromMusic21(part.getKeySignatures()[0])
-                ts = UITimeSignature.fromMusic21(part.getTimeSignatures()[0])
-                self.addPart(cl, keysig=ks, timesig=ts)
+            self.__rebuild(project)
+            return
+        if self.__layout != self.__layoutOf(project):
+            self.__rebuild(project)
+            return
+        if self.parts() == 0:
+            return
 
         if startOffset is None:
-            st_idx, st_offset = 0, 0
-        else:
-            st_idx, st_offset = self.__measureIndexFromOffset(startOffset, extend=True)
+            startOffset = 0.0
         if endOffset is None:
-            _, en_off1 = self.__endOfDisplay()
-            en_off2 = max(map(lambda strm: strm.highestTime, project.parts))
-            en_off = max(en_off1, en_off2) + 1
-            en_idx, en_offset = self.__measureIndexFromOffset(en_off, extend=True)
-            # Pad out the end of the updated region to include the entire last measure.
-            mea = self.__measures[0][en_idx]
-            en_offset += mea.length()
+            endOffset = self.__endOfProject(project)
+
+        st_idx, _ = self.__measureIndexFromOffset(startOffset, extend=True)
+        en_idx, en_offset = self.__measureIndexFromOffset(endOffset, extend=True)
+        # A region ending right on a barline doesn't reach into the next measure
+        if en_offset < endOffset or en_idx == st_idx:
             en_idx += 1
-        else:
-            en_idx, en_offset = self.__measureIndexFromOffset(endOffset, extend=True)
+        self.__redrawMeasures(project, st_idx, en_idx)
+
+    def __layoutOf(self, project) -> Tuple[int, Tuple[Tuple[float, str], ...]]:
+        """Summarize what decides where every measure of the score goes."""
+        if len(project.parts) == 0:
+            return (0, ())
+        timesigs = project.parts[0].getElementsByClass(music21.meter.TimeSignature)
+        return (
+            len(project.parts),
+            tuple((ts.offset, ts.ratioString) for ts in timesigs),
+        )
 
-        # Erase the contents of the measures to be updated.
-        for i in range(st_idx, en_idx):
-            while st_idx > len(self.__measures[0]):
-                self.addLine()
-            for meas in self.__measures:
-                meas[i].clear()
+    def __endOfProject(self, project) -> float:
+        """Return the offset at which the last part of the project ends."""
+        return max((part.highestTime for part in project.parts), default=0.0)
+
+    def __rebuild(self, project) -> None:
+        """Redraw the entire score, parts and all."""
+        self.clear()
+        for part in project.parts:
+            cl = UIClef.fromMusic21(part.getElementsByClass(music21.clef.Clef)[0])
+            ks = UIKeySignature.fromMusic21(
+                part.getElementsByClass(music21.key.KeySignature)[0]
+            )
+            ts = UITimeSignature.fromMusic21(
+                part.getElementsByClass(music21.meter.TimeSignature)[0]
+            )
+            self.addPart(cl, keysig=ks, timesig=ts)
+        self.__layout = self.__layoutOf(project)
+
+        if len(self.__measures) == 0:
+            return
+        self.__redrawMeasures(project, 0)
+
+    def __ensureStarts(self) -> None:
+        """Bring the offsets at which measures begin up to date."""
+        measures = self.__measures[0]
+        starts = self.__starts
+        while len(starts) <= len(measures):
+            starts.append(starts[-1] + measures[len(starts) - 1].length())
+
+    def __invalidateStarts(self, index: int) -> None:
+        """Note that the length of the measure at index may have changed."""
+        del self.__starts[index + 1 :]
+
+    def __offsetOfMeasure(self, index: int) -> float:
+        """Return the offset at which the measure at index begins."""
+        self.__ensureStarts()
+        return self.__starts[index]
+
+    def __setTimesig(self, part: int, idx: int, ts, newTimesig: bool) -> None:
+        """Set the time signature of a measure, keeping measure offsets right."""
+        mea = self.__measures[part][idx]
+        length = mea.length()
+        mea.setTimesig(ts, newTimesig=newTimesig)
+        # Only the first part decides where measures begin
+        if part == 0 and mea.length() != length:
+            self.__invalidateStarts(idx)
+
+    def __redrawMeasures(
+        self, project, st_idx: int, en_idx: Optional[int] = None
+    ) -> None:
+        """
+        Clear and refill the measures from st_idx up to, but excluding, en_idx.
+
+        If en_idx is None, carry on through the end of the score instead.
+
+        Measures carry on with the clef, key and time signature of the measure
+        before them. If that leaves the measures after the region with a clef
+        or key signature they no longer inherit, those are redrawn too.
+        """
+        st_offset = self.__offsetOfMeasure(st_idx)
+        if en_idx is None:
+            # Past anything in the project, even things at its very end
+            en_offset = self.__endOfProject(project) + 1
+        else:
+            en_offset = self.__offsetOfMeasure(en_idx)
 
-        # Insert everything within the time interval being updated back into the
-        # appropriate measures.
         for part in range(len(project.parts)):
-            for om_item in musicFuns.boundedOffset(
-                project.parts[part], (st_offset, en_offset)
+            items = musicFuns.boundedOffset(project.parts[part], (st_offset, en_offset))
+            self.__refill(part, items, st_idx, en_idx)
+
+        if en_idx is None or en_idx >= self.measures():
+            return
+        if self.__inheritanceChanged(en_idx):
+            self.__redrawMeasures(project, en_idx)
+
+    def __refill(self, part: int, items, st_idx: int, en_idx: Optional[int]) -> None:
+        """
+        Clear the measures of a part from st_idx on, and draw items into them.
+
+        items must be sorted by offset. Measures are filled in order, so that
+        the start of each measure is known by the time its items are drawn,
+        even if a time signature earlier on changed it.
+        """
+        items = iter(items)
+        pending = next(items, None)
+        idx = st_idx
+        while pending is not None or idx < (
+            self.measures() if en_idx is None else en_idx
+        ):
+            if idx >= self.measures():
+                self.addLine()
+            self.__carryOver(part, idx)
+            while pending is not None and pending.offset < self.__offsetOfMeasure(
+                idx + 1
             ):
-                offs = om_item.offset
-                obj = om_item.element
-
-                idx, meaoffs = self.__measureIndexFromOffset(offs, extend=True)
-                mea = self.__measures[part][idx]
-
-                if isinstance(obj, music21.clef.Clef):
-                    cl = UIClef.fromMusic21(obj)
-                    if idx == 0:
-                        mea.setClef(cl, newClef=True)
-                    else:
-                        lastCl = self.__measures[part][idx - 1].clef()
-                        mea.setClef(cl, newClef=(cl == lastCl))
-                elif isinstance(obj, music21.key.KeySignature):
-                    ks = UIKeySignature.fromMusic21(obj)
-                    if idx == 0:
-                        mea.setKeysig(ks, newKeysig=True)
-                    else:
-                        lastKs = self.__measures[part][idx - 1].keysig()
-                        mea.setKeysig(ks, newKeysig=(ks == lastKs))
-
-                elif isinstance(obj, music21.meter.TimeSignature):
-                    if idx == 0:
-                        mea.setTimesig(ts, newTimesig=True)
-                    else:
-                        lastTs = self.__measures[part][idx - 1].timesig()
-                        mea.setTimesig(ts, newTimesig=(ts == lastTs))
-                elif isinstance(obj, music21.note.Note):
-                    ntype = UINote.ntypeFromMusic21(obj)
-                    self.insertNote(part, obj.pitch, ntype, offs)
+                self.__place(part, idx, pending)
+                pending = next(items, None)
+            idx += 1
+
+    def __carryOver(self, part: int, idx: int) -> None:
+        """Clear a measure, and have it inherit from the measure before it."""
+        mea = self.__measures[part][idx]
+        mea.clear()
+        if idx > 0:
+            last = self.__measures[part][idx - 1]
+            mea.setClef(last.clef(), newClef=False)
+            mea.setKeysig(last.keysig(), newKeysig=False)
+            self.__setTimesig(part, idx, last.timesig(), False)
+
+    def __inheritanceChanged(self, idx: int) -> bool:
+        """Check whether the measure at idx differs from the one before it."""
+        for measures in self.__measures:
+            (last, mea) = (measures[idx - 1], measures[idx])
+            if not (last.clef() == mea.clef() and last.keysig() == mea.keysig()):
+                return True
+        return False
+
+    def __place(self, part: int, idx: int, om_item) -> None:
+        """Draw an element of a part into the measure at idx."""
+        offs = om_item.offset
+        obj = om_item.element
+        mea = self.__measures[part][idx]
+        last = self.__measures[part][idx - 1] if idx > 0 else None
+
+        if isinstance(obj, music21.clef.Clef):
+            cl = UIClef.fromMusic21(obj)
+            mea.setClef(cl, newClef=(last is None or not cl == last.clef()))
+        elif isinstance(obj, music21.key.KeySignature):
+            ks = UIKeySignature.fromMusic21(obj)
+            mea.setKeysig(ks, newKeysig=(last is None or not ks == last.keysig()))
+        elif isinstance(obj, music21.meter.TimeSignature):
+            ts = UITimeSignature.fromMusic21(obj)
+            self.__setTimesig(
+                part, idx, ts, newTimesig=(last is None or not ts == last.timesig())
+            )
+        elif isinstance(obj, music21.note.Note):
+            ntype = UINote.ntypeFromMusic21(obj)
+            self.insertNote(part, obj.pitch, ntype, offs)
 
     def __endOfDisplay(self) -> Tuple[int, float]:
         """
@@ -143,12 +252,8 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
         """
         if len(self.__measures) == 0:
             return (None, None)
-        mea_offset = 0
-        mea_index = 0
-        for mea in self.__measures[0]:
-            mea_offset += self.__measures[0][mea_index].length()
-            mea_index += 1
-        return mea_index, mea_offset
+        mea_index = len(self.__measures[0])
+        return mea_index, self.__offsetOfMeasure(mea_index)
 
     def __measureIndexFromOffset(
         self, offset: float, extend: bool = False
@@ -170,22 +275,16 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
         """
         if len(self.__measures) == 0:
             return (None, None)
-        mea_offset = 0
-        mea_index = 0
-        while mea_offset <= offset:
-            if mea_index >= len(self.__measures[0]):
-                if extend:
-                    self.addLine()
-                else:
-                    return (None, None)
-            mea = self.__measures[0][mea_index]
-            mea_offset += mea.length()
-            mea_index += 1
-
-        mea_offset -= mea.length()
-        mea_index -= 1
-
-        return mea_index, mea_offset
+
+        self.__ensureStarts()
+        while self.__starts[-1] <= offset:
+            if not extend:
+                return (None, None)
+            self.addLine()
+            self.__ensureStarts()
+
+        mea_index = bisect_right(self.__starts, offset) - 1
+        return mea_index, self.__starts[mea_index]
 
     def clear(self) -> None:
         """Clear the score."""
@@ -193,6 +292,7 @@ class UIScoreViewport(QtWidgets.QGraphicsView):
             self.__scoreScene.removeItem(sg)
         self.__lines.clear()
         self.__measures.clear()
+        self.__starts = [0.0]
 
     def addPart(self, clef, keysig=None, timesig=None) -> None:
         """Add a part to the score."""
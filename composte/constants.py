@@ -31,39 +31,78 @@ DEBUG_MESSAGES = {
 }
 
 
-def MUSIC_FUN_LOOKUP_TABLE(musicObject, args):
-    """Lookup table for music functions."""
-    return {
-        "changeKeySignature": (
-            musicFuns.changeKeySignature,
-            [float(args[0]), musicObject, int(args[2])],
-        ),
-        "insertNote": (
-            musicFuns.insertNote,
-            [float(args[0]), musicObject, args[2], float(args[3])],
-        ),
-        "removeNote": (musicFuns.removeNote, [float(args[0]), musicObject, args[2]]),
-        "insertMetronomeMark": (
-            musicFuns.insertMetronomeMark,
-            [float(args[0]), musicObject, int(args[1])],
-        ),
-        "removeMetronomeMark": (
-            musicFuns.removeMetronomeMark,
-            [float(args[0]), musicObject],
-        ),
-        "transpose": (musicFuns.transpose, [musicObject, int(args[1])]),
-        "insertClef": (musicFuns.insertClef, [float(args[0]), musicObject, args[2]]),
-        "removeClef": (musicFuns.removeClef, [float(args[0]), musicObject]),
-        "insertMeasures": (
-            musicFuns.insertMeasures,
-            [float(args[0]), musicObject, float(args[2])],
-        ),
-        "addInstrument": (
-            musicFuns.addInstrument,
-            [float(args[0]), musicObject, args[2]],
-        ),
-        "removeInstrument": (musicFuns.removeInstrument, [float(args[0]), musicObject]),
-        "addDynamic": (musicFuns.addDynamic, [float(args[0]), musicObject, args[2]]),
-        "removeDynamic": (musicFuns.removeDynamic, [float(args[0]), musicObject]),
-        "addLyric": (musicFuns.addLyric, [float(args[0]), musicObject, args[2]]),
-    }
+# fname -> (function, decoder), where decoder turns the part (or parts) an
+# update applies to and its JSON arguments into the arguments of function.
+# Only the arguments of the function actually called are ever converted.
+MUSIC_FUN_LOOKUP_TABLE = {
+    "changeKeySignature": (
+        musicFuns.changeKeySignature,
+        lambda musicObject, args: [float(args[0]), musicObject, int(args[2])],
+    ),
+    "insertNote": (
+        musicFuns.insertNote,
+        lambda musicObject, args: [
+            float(args[0]),
+            musicObject,
+            args[2],
+            float(args[3]),
+        ],
+    ),
+    "removeNote": (
+        musicFuns.removeNote,
+        lambda musicObject, args: [float(args[0]), musicObject, args[2]],
+    ),
+    "insertMetronomeMark": (
+        musicFuns.insertMetronomeMark,
+        lambda musicObject, args: [float(args[0]), musicObject, int(args[1])],
+    ),
+    "removeMetronomeMark": (
+        musicFuns.removeMetronomeMark,
+        lambda musicObject, args: [float(args[0]), musicObject],
+    ),
+    "transpose": (
+        musicFuns.transpose,
+        lambda musicObject, args: [musicObject, int(args[1])],
+    ),
+    "transposeRange": (
+        musicFuns.transposeRange,
+        lambda musicObject, args: [
+            float(args[0]),
+            musicObject,
+            int(args[2]),
+            float(args[3]),
+        ],
+    ),
+    "insertClef": (
+        musicFuns.insertClef,
+        lambda musicObject, args: [float(args[0]), musicObject, args[2]],
+    ),
+    "removeClef": (
+        musicFuns.removeClef,
+        lambda musicObject, args: [float(args[0]), musicObject],
+    ),
+    "insertMeasures": (
+        musicFuns.insertMeasures,
+        lambda musicObject, args: [float(args[0]), musicObject, float(args[2])],
+    ),
+    "addInstrument": (
+        musicFuns.addInstrument,
+        lambda musicObject, args: [float(args[0]), musicObject, args[2]],
+    ),
+    "removeInstrument": (
+        musicFuns.removeInstrument,
+        lambda musicObject, args: [float(args[0]), musicObject],
+    ),
+    "addDynamic": (
+        musicFuns.addDynamic,
+        lambda musicObject, args: [float(args[0]), musicObject, args[2]],
+    ),
+    "removeDynamic": (
+        musicFuns.removeDynamic,
+        lambda musicObject, args: [float(args[0]), musicObject],
+    ),
+    "addLyric": (
+        musicFuns.addLyric,
+        lambda musicObject, args: [float(args[0]), musicObject, args[2]],
+    ),
+}
@@ -4,26 +4,266 @@
 
 import json
 import sqlite3
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from threading import Lock
-from typing import Optional
+from typing import Callable, Dict, Hashable, Optional
+
+# Prepared statements kept around by each connection. We only have a handful.
+STATEMENT_CACHE_SIZE = 64
+
+# Seconds to wait on a database locked by another process before giving up
+BUSY_TIMEOUT = 5.0
+
+# Seconds that cached lookups are trusted for, and how many are kept per table
+CACHE_TTL = 60.0
+CACHE_SIZE = 4096
 
 
 # We are inspired by Django, but we're not that good at introspection/reflection
-def get_connection(dbname: str):
+def get_connection(dbname: str, check_same_thread: bool = True):
     """
     Open a databse connection.
 
     Make sure that foreign key constraints are enabled for every connection,
     because they aren't by default and for some reason that can be changed
     _per connection_.
+
+    The database is put in write-ahead logging mode, so that readers never
+    wait on a writer, and only syncs to disk at checkpoints rather than on
+    every commit. A crash may lose the last few commits, but never corrupts
+    the database.
     """
-    conn = sqlite3.connect(dbname)
+    conn = sqlite3.connect(
+        dbname,
+        timeout=BUSY_TIMEOUT,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+    )
     conn.execute('PRAGMA foreign_keys = "1"')  # ಠ_ಠ
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
     conn.commit()
     return conn
 
 
+# The schema, as a list of migrations. Migration i brings a database from
+# schema version i to version i + 1, and the version a database is at is kept
+# in its user_version. Only ever append to this.
+MIGRATIONS = [
+    # The tables as they were before schema versions were recorded, which may
+    # well exist already
+    (
+        """ CREATE TABLE IF NOT EXISTS auth
+            ( username TEXT PRIMARY KEY NOT NULL,
+              hash TEXT NOT NULL,
+              email TEXT)""",
+        """ CREATE TABLE IF NOT EXISTS projects
+            ( id TEXT PRIMARY KEY NOT NULL,
+              name TEXT NOT NULL,
+              owner TEXT NOT NULL REFERENCES auth(username))""",
+        """ CREATE TABLE IF NOT EXISTS contributors (
+                username TEXT NOT NULL REFERENCES auth(username),
+                project_id TEXT NOT NULL REFERENCES projects(id),
+                PRIMARY KEY (username, project_id)) """,
+    ),
+    # The primary key of contributors only helps to look up by username
+    (
+        """ CREATE INDEX IF NOT EXISTS contributors_by_project
+            ON contributors (project_id)""",
+        """ CREATE INDEX IF NOT EXISTS projects_by_owner
+            ON projects (owner)""",
+    ),
+    # Snapshots of projects, for storage.SQLiteStorage. These used to be
+    # created by the storage itself, so they may well exist already
+    (
+        """ CREATE TABLE IF NOT EXISTS project_snapshots (
+                project_id TEXT PRIMARY KEY NOT NULL REFERENCES projects(id),
+                metadata TEXT NOT NULL) """,
+        """ CREATE TABLE IF NOT EXISTS project_parts (
+                project_id TEXT NOT NULL REFERENCES projects(id),
+                name TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (project_id, name)) """,
+    ),
+]
+
+
+class ConnectionManager:
+    """
+    Hand out connections to a database, one per thread.
+
+    sqlite3 connections and cursors must not be shared between threads, so
+    every thread gets its own connection, opened the first time it asks for
+    one. Each connection caches its prepared statements, so running the same
+    query again is cheap.
+
+    Any number of threads may read at once. Writes are serialized here, so
+    that they queue up in order instead of failing on a locked database.
+    """
+
+    def __init__(self, dbname: str):
+        """Manage connections to the database dbname."""
+        self.__dbname = dbname
+        self.__local = threading.local()
+        self.__write_lock = Lock()
+
+        self.__connections = []
+        self.__connections_lock = Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """Retrieve the connection of the calling thread, opening it if need be."""
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            # Only ever used by this thread, but closed by whoever calls close()
+            conn = get_connection(self.__dbname, check_same_thread=False)
+            self.__local.conn = conn
+            with self.__connections_lock:
+                self.__connections.append(conn)
+        return conn
+
+    def fetchone(self, query: str, params: tuple = ()):
+        """Run a query and retrieve the first row of the result."""
+        return self.connection().execute(query, params).fetchone()
+
+    def fetchall(self, query: str, params: tuple = ()):
+        """Run a query and retrieve every row of the result."""
+        return self.connection().execute(query, params).fetchall()
+
+    @contextmanager
+    def writing(self):
+        """
+        Hold the write lock, and commit on the way out.
+
+        Yields the connection of the calling thread. If anything goes wrong,
+        the changes are rolled back instead, and the exception propagates.
+        """
+        conn = self.connection()
+        with self.__write_lock:
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        """Run a single write and commit it."""
+        with self.writing() as conn:
+            conn.execute(query, params)
+
+    def migrate(self, migrations=MIGRATIONS) -> int:
+        """
+        Bring the schema of the database up to date.
+
+        Applies whichever migrations the database hasn't seen yet, all in one
+        transaction, and returns the schema version it ends up at. Running it
+        again on an up to date database does nothing.
+        """
+        with self.writing() as conn:
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version >= len(migrations):
+                return version
+
+            conn.execute("BEGIN")
+            for statements in migrations[version:]:
+                for statement in statements:
+                    conn.execute(statement)
+            # PRAGMA doesn't take parameters, but this is our own integer
+            conn.execute("PRAGMA user_version = {:d}".format(len(migrations)))
+            return len(migrations)
+
+    def close(self) -> None:
+        """Close every connection handed out so far."""
+        with self.__connections_lock:
+            (connections, self.__connections) = (self.__connections, [])
+        for conn in connections:
+            conn.close()
+        self.__local = threading.local()
+
+
+_managers = {}
+_managers_lock = Lock()
+
+
+def get_manager(dbname: str) -> ConnectionManager:
+    """Retrieve the connection manager for dbname, shared by every table."""
+    with _managers_lock:
+        manager = _managers.get(dbname, None)
+        if manager is None:
+            manager = ConnectionManager(dbname)
+            _managers[dbname] = manager
+        return manager
+
+
+class ReadCache:
+    """
+    Remember the results of lookups for a while.
+
+    Entries expire ttl seconds after they were looked up, and the least
+    recently used entries make way once there are more than maxsize of them.
+    Whoever writes to the table must invalidate the keys it affects.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, maxsize: int = CACHE_SIZE):
+        """Initialize an empty cache."""
+        self.__ttl = ttl
+        self.__maxsize = maxsize
+        # key -> (expiry, value)
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+        # Bumped by every invalidation, so that lookups that raced with a
+        # write don't cache what they read from before it
+        self.__generation = 0
+
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: Hashable, lookup: Callable):
+        """Retrieve the value for key, calling lookup() if it isn't cached."""
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key, None)
+            if entry is not None and now < entry[0]:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return entry[1]
+            self.__misses += 1
+            generation = self.__generation
+
+        value = lookup()
+
+        with self.__lock:
+            if generation == self.__generation:
+                self.__entries[key] = (now + self.__ttl, value)
+                self.__entries.move_to_end(key)
+                while len(self.__entries) > self.__maxsize:
+                    self.__entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Forget the values for keys."""
+        with self.__lock:
+            self.__generation += 1
+            for key in keys:
+                self.__entries.pop(key, None)
+
+    def stats(self) -> Dict[str, float]:
+        """Report how well the cache is doing."""
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                "entries": len(self.__entries),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / lookups if lookups else 0.0,
+            }
+
+
 # TODO: Make me and projects dataclasses
 class User:
     """POD class representing users."""
@@ -51,47 +291,45 @@ class Auth:
     # We're so bad at CRUD that we only bother to do half of it
     __blueprint = ("username", "hash", "email")
 
-    def __init__(self, dbname: str):
-        """Initialize the auth database."""
-        self.__conn = get_connection(dbname)
-        self.__cursor = self.__conn.cursor()
-
-        self.__cursor.execute(
-            """ CREATE TABLE IF NOT EXISTS auth
-                ( username TEXT PRIMARY KEY NOT NULL,
-                  hash TEXT NOT NULL,
-                  email TEXT)"""
-        )
-        self.__conn.commit()
-        self.__lock = Lock()
+    def __init__(self, dbname: str, ttl: float = CACHE_TTL):
+        """Initialize the auth database, caching lookups for ttl seconds."""
+        self.__db = get_manager(dbname)
+        self.__cache = ReadCache(ttl)
+
+        self.__db.migrate()
 
     # Create
     def put(self, username: str, hash_: str, email: str = "null"):
         """Create a new auth record."""
-        with self.__lock:
-            self.__cursor.execute(
-                """
-                    INSERT INTO auth (username, hash, email)
-                    VALUES (?, ?, ?)
-                    """,
-                (username, hash_, email),
-            )
-            self.__conn.commit()
+        self.__db.execute(
+            """
+                INSERT INTO auth (username, hash, email)
+                VALUES (?, ?, ?)
+                """,
+            (username, hash_, email),
+        )
+        self.__cache.invalidate(username)
 
     # Retrieve
     def get(self, username: str):
         """Attempt to retrieve an existing auth record."""
-        self.__cursor.execute(
+        return self.__cache.get(username, lambda: self.__get(username))
+
+    def __get(self, username: str):
+        tup = self.__db.fetchone(
             """
                 SELECT * FROM auth WHERE username=?
                 """,
             (username,),
         )
-        tup = self.__cursor.fetchone()
         if tup is None:
             return User(None, None, None)
         return User(*tup)
 
+    def cache_stats(self) -> Dict[str, float]:
+        """Report how well cached lookups are doing."""
+        return self.__cache.stats()
+
 
 class Project:
     """Dataclass holding enough information identify composte projects."""
@@ -116,67 +354,53 @@ class Projects:
 
     __blueprint = ("id", "name", "owner")
 
-    def __init__(self, dbname: str):
-        """Initialize the project database."""
-        self.__conn = get_connection(dbname)
-        self.__cursor = self.__conn.cursor()
-
-        self.__cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS projects
-                ( id TEXT PRIMARY KEY NOT NULL,
-                  name TEXT NOT NULL,
-                  owner TEXT NOT NULL REFERENCES auth(username))"""
-        )
+    def __init__(self, dbname: str, ttl: float = CACHE_TTL):
+        """Initialize the project database, caching lookups for ttl seconds."""
+        self.__db = get_manager(dbname)
+        self.__cache = ReadCache(ttl)
 
-        self.__conn.commit()
-
-        self.__lock = Lock()
+        self.__db.migrate()
 
     def put(self, id_: uuid.UUID, name: str, owner: str) -> None:
         """Insert a project record."""
-        with self.__lock:
-            self.__cursor.execute(
-                """
-                    INSERT INTO projects (id, name, owner)
-                    VALUES (?, ?, ?)
-                    """,
-                (id_, name, owner),
-            )
-            self.__conn.commit()
+        self.__db.execute(
+            """
+                INSERT INTO projects (id, name, owner)
+                VALUES (?, ?, ?)
+                """,
+            (id_, name, owner),
+        )
+        self.__cache.invalidate(str(id_))
 
     def get(self, id_: uuid.UUID):
         """Retrieve a project record."""
-        self.__cursor.execute(
+        return self.__cache.get(str(id_), lambda: self.__get(id_))
+
+    def __get(self, id_: uuid.UUID):
+        tup = self.__db.fetchone(
             """
                 SELECT * FROM projects WHERE id=?
                 """,
             (id_,),
         )
-        tup = self.__cursor.fetchone()
         if tup is None:
             return Project(None, None, None)
         return Project(*tup)
 
+    def cache_stats(self) -> Dict[str, float]:
+        """Report how well cached lookups are doing."""
+        return self.__cache.stats()
+
 
 class Contributors:
     """CRU̶D̶ wrapper around contributor relationships between Users and Projects."""
 
-    def __init__(self, dbname: str):
-        """Initialize contributor database."""
-        self.__conn = get_connection(dbname)
-        self.__cursor = self.__conn.cursor()
-
-        self.__cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS contributors (
-                    username TEXT NOT NULL REFERENCES auth(username),
-                    project_id TEXT NOT NULL REFERENCES projects(id),
-                    PRIMARY KEY (username, project_id)) """
-        )
-        self.__conn.commit()
+    def __init__(self, dbname: str, ttl: float = CACHE_TTL):
+        """Initialize contributor database, caching lookups for ttl seconds."""
+        self.__db = get_manager(dbname)
+        self.__cache = ReadCache(ttl)
 
-        self.__lock = Lock()
+        self.__db.migrate()
 
     def put(self, username: str, project_id: uuid.UUID) -> None:
         """
@@ -184,14 +408,14 @@ class Contributors:
 
         Equivalent to declaring that a username is a contributor to project_id
         """
-        self.__cursor.execute(
+        self.__db.execute(
             """
                 INSERT INTO contributors (username, project_id)
                 VALUES (?, ?)
                 """,
             (username, project_id),
         )
-        self.__conn.commit()
+        self.__cache.invalidate(("users", str(project_id)), ("projects", username))
 
     def get(
         self, username: Optional[str] = None, project_id: Optional[uuid.UUID] = None
@@ -216,21 +440,30 @@ class Contributors:
 
     def get_users(self, project_id: Optional[uuid.UUID]):
         """Retrieve users who are contributors to the project."""
-        with self.__lock:
-            self.__cursor.execute(
+        return [User(uname) for uname in self.__usernames(project_id)]
+
+    def is_contributor(self, username: str, project_id: uuid.UUID) -> bool:
+        """Check whether a user is a contributor to a project."""
+        return username in self.__usernames(project_id)
+
+    def __usernames(self, project_id: uuid.UUID):
+        def lookup():
+            users = self.__db.fetchall(
                 """
                     SELECT username FROM contributors
                     WHERE project_id=?
                     """,
                 (project_id,),
             )
-            users = self.__cursor.fetchall()
-            return [User(*user) for user in users]
+            return tuple(uname for (uname,) in users)
+
+        return self.__cache.get(("users", str(project_id)), lookup)
 
     def get_projects(self, username: Optional[str]):
         """Retrieve projects that the user can contribute to."""
-        with self.__lock:
-            self.__cursor.execute(
+
+        def lookup():
+            return self.__db.fetchall(
                 """
                     SELECT projects.id, projects.name, projects.owner
                     FROM projects INNER JOIN contributors
@@ -239,5 +472,10 @@ class Contributors:
                     """,
                 (username,),
             )
-            projects = self.__cursor.fetchall()
-            return [Project(*project) for project in projects]
+
+        projects = self.__cache.get(("projects", username), lookup)
+        return [Project(*project) for project in projects]
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Report how well cached lookups are doing."""
+        return self.__cache.stats()
@@ -0,0 +1,252 @@
+"""
+Backends that keep snapshots of projects.
+
+A snapshot is the metadata of a project, including its version and the names
+its parts are stored under, along with those parts. Only parts that changed
+since they were last stored are written out, each under a fresh name, and
+parts that the new snapshot no longer names are removed once it is in place.
+"""
+import base64
+import json
+import os
+import uuid
+from typing import List, Optional, Sequence, Tuple
+
+from composte.db import driver
+from composte.util import composteProject
+from composte.util.classExceptions import virtualmethod
+
+
+class ProjectStorage:
+    """Somewhere to keep snapshots of projects."""
+
+    @virtualmethod
+    def write(self, projects: Sequence[composteProject.ComposteProject]) -> None:
+        """Store snapshots of projects, marking their parts stored."""
+
+    @virtualmethod
+    def read(self, pid: str) -> composteProject.ComposteProject:
+        """Load the last snapshot of a project."""
+
+    def close(self) -> None:
+        """Let go of anything held on to between reads and writes."""
+
+
+def _unstored(
+    project: composteProject.ComposteProject,
+) -> Tuple[List[str], List[Tuple[int, str]]]:
+    """
+    Pick fresh names for the parts of a project that need to be stored.
+
+    Returns the names of every part in the new snapshot, and the index and
+    name of each part that has to be written out under its new name.
+    """
+    names = project.parts.storedNames()
+    fresh = []
+    for (i, name) in enumerate(names):
+        if name is None:
+            names[i] = uuid.uuid4().hex
+            fresh.append((i, names[i]))
+    return (names, fresh)
+
+
+class FileStorage(ProjectStorage):
+    """
+    Snapshots kept as loose files, under the directory of their owner.
+
+    Every part lives in a file of its own, under <owner>/<pid>.parts/, and
+    the metadata in <owner>/<pid>.meta, which is replaced last. Projects from
+    before parts were stored separately live in <owner>/<pid>.heap instead.
+    """
+
+    __project_extension = ".heap"
+    __metadata_extension = ".meta"
+    __parts_extension = ".parts"
+
+    def __init__(self, project_root: str, projects: driver.Projects):
+        """
+        Keep snapshots under project_root.
+
+        projects is used to look up who owns a project when reading it.
+        """
+        self.__project_root = project_root
+        self.__projects = projects
+        os.makedirs(self.__project_root, exist_ok=True)
+
+    def __project_path(self, owner: str, pid: str) -> str:
+        return os.path.join(self.__project_root, owner, pid)
+
+    def write(self, projects: Sequence[composteProject.ComposteProject]) -> None:
+        """
+        Store snapshots of projects, one after another.
+
+        Each snapshot is written atomically, but a failure part way through
+        leaves the projects before it stored.
+        """
+        for project in projects:
+            self.__write(project)
+
+    def __write(self, project: composteProject.ComposteProject) -> None:
+        base_path = self.__project_path(
+            project.metadata["owner"], str(project.project_id)
+        )
+        parts_path = base_path + self.__parts_extension
+        os.makedirs(parts_path, exist_ok=True)
+
+        (names, fresh) = _unstored(project)
+        for (i, name) in fresh:
+            with open(os.path.join(parts_path, name), "w") as f:
+                f.write(project.parts.frozenPart(i))
+                f.flush()
+                os.fsync(f.fileno())
+            project.parts.markStored(i, name)
+
+        metadata = project.serializeMetadata(parts=names)
+        with open(base_path + self.__metadata_extension + ".tmp", "w") as f:
+            f.write(metadata)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(
+            base_path + self.__metadata_extension + ".tmp",
+            base_path + self.__metadata_extension,
+        )
+
+        for stale in set(os.listdir(parts_path)) - set(names):
+            os.remove(os.path.join(parts_path, stale))
+        try:
+            os.remove(base_path + self.__project_extension)
+        except FileNotFoundError:
+            pass
+
+    def __read_parts(self, base_path: str, names: Optional[List[str]]) -> str:
+        """Read the frozen parts of a project, in whichever layout they are in."""
+        if names is None:
+            with open(base_path + self.__project_extension, "r") as f:
+                return f.read()
+
+        parts = []
+        for name in names:
+            with open(os.path.join(base_path + self.__parts_extension, name)) as f:
+                parts.append(f.read())
+        return json.dumps(parts)
+
+    def read(self, pid: str) -> composteProject.ComposteProject:
+        """Load the last snapshot of a project."""
+        base_path = self.__project_path(self.__projects.get(pid).owner, pid)
+
+        with open(base_path + self.__metadata_extension, "r") as f:
+            metadata = json.loads(f.read())
+        names = metadata.pop("parts", None)
+        parts = self.__read_parts(base_path, names)
+
+        return composteProject.deserializeProject(
+            (json.dumps(metadata), parts, pid), names
+        )
+
+
+class SQLiteStorage(ProjectStorage):
+    """
+    Snapshots kept in the database, alongside the projects table.
+
+    Metadata lives in project_snapshots and parts, as raw bytes, in
+    project_parts. Writing any number of projects is a single transaction,
+    so either every snapshot is replaced or none of them are.
+    """
+
+    def __init__(self, dbname: str):
+        """Keep snapshots in the database dbname."""
+        self.__db = driver.get_manager(dbname)
+        self.__db.migrate()
+
+    def write(self, projects: Sequence[composteProject.ComposteProject]) -> None:
+        """Store snapshots of projects, all or nothing."""
+        written = []
+        with self.__db.writing() as conn:
+            for project in projects:
+                written.extend(self.__write(conn, project))
+
+        # Only once they are committed
+        for (project, i, name) in written:
+            project.parts.markStored(i, name)
+
+    def __write(self, conn, project: composteProject.ComposteProject):
+        pid = str(project.project_id)
+        (names, fresh) = _unstored(project)
+
+        for (i, name) in fresh:
+            self.__write_part(
+                conn, pid, name, base64.b64decode(project.parts.frozenPart(i))
+            )
+
+        conn.execute(
+            """
+                INSERT OR REPLACE INTO project_snapshots (project_id, metadata)
+                VALUES (?, ?)
+                """,
+            (pid, project.serializeMetadata(parts=names)),
+        )
+
+        named = set(names)
+        stored = conn.execute(
+            "SELECT name FROM project_parts WHERE project_id = ?", (pid,)
+        ).fetchall()
+        conn.executemany(
+            "DELETE FROM project_parts WHERE project_id = ? AND name = ?",
+            [(pid, name) for (name,) in stored if name not in named],
+        )
+
+        return [(project, i, name) for (i, name) in fresh]
+
+    @staticmethod
+    def __write_part(conn, pid: str, name: str, data: bytes) -> None:
+        """
+        Write out a part.
+
+        Where sqlite3 supports it, room is made for the part and it is copied
+        straight into the blob, rather than being bound as a parameter.
+        """
+        if not hasattr(conn, "blobopen"):
+            conn.execute(
+                """
+                    INSERT INTO project_parts (project_id, name, data)
+                    VALUES (?, ?, ?)
+                    """,
+                (pid, name, data),
+            )
+            return
+
+        cursor = conn.execute(
+            """
+                INSERT INTO project_parts (project_id, name, data)
+                VALUES (?, ?, zeroblob(?))
+                """,
+            (pid, name, len(data)),
+        )
+        with conn.blobopen("project_parts", "data", cursor.lastrowid) as blob:
+            blob.write(data)
+
+    def read(self, pid: str) -> composteProject.ComposteProject:
+        """Load the last snapshot of a project."""
+        # One statement, so the metadata and parts come from the same snapshot
+        rows = self.__db.fetchall(
+            """
+                SELECT project_snapshots.metadata, project_parts.name,
+                       project_parts.data
+                FROM project_snapshots LEFT JOIN project_parts
+                    ON project_snapshots.project_id = project_parts.project_id
+                WHERE project_snapshots.project_id = ?
+                """,
+            (pid,),
+        )
+        if not rows:
+            raise FileNotFoundError("No snapshot of project {}".format(pid))
+
+        metadata = json.loads(rows[0][0])
+        names = metadata.pop("parts")
+
+        blobs = {name: data for (_, name, data) in rows}
+        parts = [base64.b64encode(blobs[name]).decode() for name in names]
+
+        return composteProject.deserializeProject(
+            (json.dumps(metadata), json.dumps(parts), pid), names
+        )
@@ -3,7 +3,7 @@
 
 from queue import Queue
 from threading import Lock, Thread
-from typing import Callable, Optional
+from typing import Callable, Optional, Union
 
 import zmq
 
@@ -28,13 +28,27 @@ class Subscription(Loggable):
         # Subscription to remote broadcasts
         self.__addr = remote_address
         self.__socket = self.__context.socket(zmq.SUB)
-        self.__socket.setsockopt_string(zmq.SUBSCRIBE, "")
         self.__socket.connect(self.__addr)
 
         self.__backlog = Queue(1024)
         self.__lock = Lock()
 
-    def recv(self, poll_timeout: int = 500) -> Optional[str]:
+    def subscribe(self, topic: str) -> None:
+        """
+        Start receiving broadcasts for topic.
+
+        Nothing is received until at least one topic is subscribed to.
+        Broadcasts for other topics are dropped before they ever reach us.
+        """
+        with self.__lock:
+            self.__socket.setsockopt_string(zmq.SUBSCRIBE, topic)
+
+    def unsubscribe(self, topic: str) -> None:
+        """Stop receiving broadcasts for topic."""
+        with self.__lock:
+            self.__socket.setsockopt_string(zmq.UNSUBSCRIBE, topic)
+
+    def recv(self, poll_timeout: int = 500) -> Optional[bytes]:
         """
         Retrieve a message.
 
@@ -52,7 +66,8 @@ class Subscription(Loggable):
                     msg = None
                     return msg
                 for i in range(nmsg):
-                    self.__backlog.put(self.__socket.recv_string())
+                    (topic, msg) = self.__socket.recv_multipart()
+                    self.__backlog.put(msg)
                 msg = self.__backlog.get()
 
         return msg
@@ -96,12 +111,13 @@ class Client(Loggable):
         self.__lock = Lock()
         self.__background_lock = Lock()
 
-    def send(self, message: str, preprocess: Callable = lambda x: x):
+    def send(self, message: Union[str, bytes], preprocess: Callable = lambda x: x):
         """
         Send a message down the interactive socket.
 
         Blocks until a reply is received.
-        The reply is fed through preprocess before being returned.
+        Messages go out as bytes, with strings encoded as UTF-8, and the raw
+        bytes of the reply are fed through preprocess before being returned.
         """
         with self.__lock:
             try:
@@ -110,8 +126,10 @@ class Client(Loggable):
                 self.error(f"Failed to encrypt message {message}")
                 raise e
 
-            self.__isocket.send_string(message)
-            msg = self.__isocket.recv_string()
+            if isinstance(message, str):
+                message = message.encode()
+            self.__isocket.send(message)
+            msg = self.__isocket.recv()
 
             try:
                 msg = preprocess(msg)
@@ -120,6 +138,14 @@ class Client(Loggable):
                 raise e
             return msg
 
+    def subscribe(self, topic: str) -> None:
+        """Receive broadcasts for topic."""
+        self.__listener.subscribe(topic)
+
+    def unsubscribe(self, topic: str) -> None:
+        """Stop receiving broadcasts for topic."""
+        self.__listener.unsubscribe(topic)
+
     def pause_background(self):
         """Pause background actions by acquiring lock."""
         self.__background_lock.acquire()
@@ -129,7 +155,7 @@ class Client(Loggable):
         self.__background_lock.release()
 
     def __message_flow(
-        self, msg: str, handler: Callable, preprocess: Callable = lambda x: x
+        self, msg: bytes, handler: Callable, preprocess: Callable = lambda x: x
     ):
         try:
             msg = self.__translator.decrypt(msg)
@@ -222,16 +248,18 @@ if __name__ == "__main__":
     s2 = Client("tcp://127.0.0.1:5000", "tcp://127.0.0.1:5001", DevNull, Encryption())
 
     # Start broadcast handlers
+    s1.subscribe("")
+    s2.subscribe("")
     s1.start_background(echo, lambda m: f"1: {m}", 500)
     s2.start_background(echo, lambda m: f"2: {m}", 500)
 
     # Poke the server
     for i in range(10):
         rep = s1.send("Hello there", lambda m: "1: {m}")
-        print("Reply: " + rep)
+        print(f"Reply: {rep}")
 
         rep = s2.send("Are you there?", lambda m: f"2: {m}")
-        print("Reply: " + rep)
+        print(f"Reply: {rep}")
 
     # Stop the clients
     s1.stop()
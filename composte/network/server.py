@@ -6,7 +6,7 @@ import signal  # Need signal handlers to properly run as daemon
 import sys
 import traceback
 from threading import Lock, Thread
-from typing import Callable, Optional
+from typing import Callable, Union
 
 import zmq
 
@@ -23,13 +23,18 @@ class Server(Loggable):
     The network server for composte.
 
     Broadcast socket   -> Publish/Subscribe
-    Interactive socket -> Request/Reply
-
-    A REP socket replies to the client who sent the last message. This means
-    that we can't really get away with worker threads here, as
-    REQ/Processing/REP must be serialized as a cohesive unit. This problem seems
-    to be generally tractable though, per
-    https://stackoverflow.com/questions/29420666/zmq-multiple-request-reply-pairs
+    Interactive socket -> Router/Dealer, fanned out to a pool of Request/Reply
+                          workers
+
+    The ROUTER socket prefixes every request with the identity of the client
+    that sent it and hands it to the DEALER, which passes it on to whichever
+    worker is free. Each worker owns a REP socket, so REQ/Processing/REP is
+    still serialized as a cohesive unit per worker, and the envelope is put
+    back on the reply so that the ROUTER can route it to the right client.
+    See http://zguide.zeromq.org/page:all#Multithreaded-Server
+
+    Workers are threads rather than processes because handlers are free to
+    close over in-memory state, such as the project pool of a ComposteServer.
     """
 
     __context = zmq.Context()
@@ -54,9 +59,14 @@ class Server(Loggable):
         self.__translator = encryption_scheme
 
         self.__iaddr = interactive_address
-        self.__isocket = self.__context.socket(zmq.REP)
+        self.__isocket = self.__context.socket(zmq.ROUTER)
         self.__isocket.bind(self.__iaddr)
 
+        # Workers connect here to pick up requests from the interactive socket
+        self.__waddr = "inproc://composte-workers-{}".format(id(self))
+        self.__wsocket = self.__context.socket(zmq.DEALER)
+        self.__wsocket.bind(self.__waddr)
+
         self.__baddr = broadcast_address
         self.__bsocket = self.__context.socket(zmq.PUB)
         self.__bsocket.bind(self.__baddr)
@@ -64,22 +74,32 @@ class Server(Loggable):
         self.__dlock = Lock()
         self.__done = False
 
-        self.__ilock = Lock()
+        # Only the listening thread touches the interactive and worker
+        # sockets, but handlers broadcast from any worker
         self.__block = Lock()
 
         self.__listen_thread = None
+        self.__workers = []
+
+    def broadcast(self, message, topic=""):
+        """
+        Broadcast a message to all clients subscribed to topic.
 
-    def broadcast(self, message):
-        """Broadcast a message to all subscribed clients."""
-        self.info(f"Broadcasting {message}")
+        The topic goes out as its own frame ahead of the message, so clients
+        filter on it without ever looking at the message itself. Messages may
+        be bytes, or strings to be encoded as UTF-8.
+        """
+        self.info(f"Broadcasting {message} to '{topic}'")
+        if isinstance(message, str):
+            message = message.encode()
         with self.__block:
-            self.__bsocket.send_string(message)
+            self.__bsocket.send_multipart([topic.encode(), message])
 
-    def fail(self, message, reason):
-        """Send a failure message to a client."""
+    def fail(self, message, reason) -> str:
+        """Build a failure message to send to a client."""
         # Probably need a better generic failure message format, but eh
         self.error(f"Failure ({message}): {reason}")
-        self.__isocket.send_string(f"Failure ({reason}): {message}")
+        return f"Failure ({reason}): {message}"
 
     def start_background(
         self,
@@ -87,68 +107,83 @@ class Server(Loggable):
         preprocess: Callable = lambda x: x,
         postprocess: Callable = lambda msg: msg,
         poll_timeout: int = 2000,
+        workers: int = 1,
     ):
-        """Start Server.__listen_almost_forever in the background."""
+        """
+        Start Server.__listen_almost_forever in the background.
+
+        Requests are handled by a pool of worker threads, each of which runs
+        messages through the preprocess -> handler -> postprocess pipeline.
+        handler may therefore be invoked concurrently up to workers times.
+        """
         if self.__listen_thread is not None:
             return
+
+        for _ in range(workers):
+            worker = Thread(
+                target=self.__work_almost_forever,
+                args=(handler, preprocess, postprocess, poll_timeout),
+            )
+            self.__workers.append(worker)
+            worker.start()
+
         self.__listen_thread = Thread(
-            target=self.__listen_almost_forever,
-            args=(handler, preprocess, postprocess, poll_timeout),
+            target=self.__listen_almost_forever, args=(poll_timeout,)
         )
         self.__listen_thread.start()
 
+    def __is_done(self) -> bool:
+        with self.__dlock:
+            return self.__done
+
     def __message_handling_flow(
         self,
-        message: str,
+        message: bytes,
         handler: Callable = lambda x: x,
         preprocess: Callable = lambda x: x,
         postprocess: Callable = lambda msg: msg,
-    ) -> Optional[str]:
+    ) -> Union[str, bytes]:
         try:
             message = self.__translator.decrypt(message)
         except DecryptError:
-            self.fail(message, "Decryption failure")
-            return None
+            return self.fail(message, "Decryption failure")
 
         try:
             message = preprocess(message)
             reply = handler(self, message)
             reply = postprocess(reply)
         except GenericError:
-            self.fail(message, "Internal server error")
-            return None
+            return self.fail(message, "Internal server error")
 
         try:
             reply = self.__translator.encrypt(reply)
         except EncryptError:
-            self.fail(message, "Encryption failure")
-            return None
+            return self.fail(message, "Encryption failure")
+
+        if not reply:
+            return self.fail(message, "Malformed message")
 
         return reply
 
     def __create_reply(
         self,
+        message: bytes,
         handler: Callable = lambda x: x,
         preprocess: Callable = lambda x: x,
         postprocess: Callable = lambda msg: msg,
-    ):
-        message = self.__isocket.recv_string()
+    ) -> Union[str, bytes]:
         # Unconditionally catch and ignore _all_ unexpected
         # exceptions during the invocations of client-provided
         # functions
         try:
-            reply = self.__message_handling_flow(
+            return self.__message_handling_flow(
                 message, handler, preprocess, postprocess
             )
-            if reply:
-                self.__isocket.send_string(reply)
-            else:
-                self.fail(message, "Malformed message")
         except Exception:
-            self.fail(message, "Malformed message")
             self.error(f"Uncaught exception: {traceback.format_exc()}")
+            return self.fail(message, "Malformed message")
 
-    def __listen_almost_forever(
+    def __work_almost_forever(
         self,
         handler: Callable = lambda x: x,
         preprocess: Callable = lambda x: x,
@@ -156,22 +191,49 @@ class Server(Loggable):
         poll_timeout: int = 2000,
     ):
         """
-        Poll for messages on the interactive socket until the server is stopped.
+        Serve requests handed out by the dealer until the server is stopped.
 
-        poll_timeout controls how long a poll operation will wait before failing.
-        Messages are pushed through the pipeline preprocess -> handler ->
-        postprocess, and the result is sent back to as a client
+        A REP socket must reply to every message it receives before it can
+        receive another, so every request gets exactly one reply, even if that
+        reply is a failure message.
         """
+        socket = self.__context.socket(zmq.REP)
+        socket.connect(self.__waddr)
+
         try:
-            while True:
-                with self.__dlock:
-                    if self.__done:
-                        break
+            while not self.__is_done():
+                nmsg = socket.poll(poll_timeout)
+                if nmsg != 0:
+                    message = socket.recv()
+                    reply = self.__create_reply(
+                        message, handler, preprocess, postprocess
+                    )
+                    if isinstance(reply, str):
+                        reply = reply.encode()
+                    socket.send(reply)
+        finally:
+            socket.close()
+
+    def __listen_almost_forever(self, poll_timeout: int = 2000):
+        """
+        Shuttle messages between clients and workers until the server is stopped.
 
-                with self.__ilock:
-                    nmsg = self.__isocket.poll(poll_timeout)
-                    if nmsg != 0:
-                        self.__create_reply(handler, preprocess, postprocess)
+        poll_timeout controls how long a poll operation will wait before failing.
+        Requests are passed from the interactive socket to the workers, and
+        replies from the workers are routed back to the clients that asked for
+        them, envelopes and all.
+        """
+        poller = zmq.Poller()
+        poller.register(self.__isocket, zmq.POLLIN)
+        poller.register(self.__wsocket, zmq.POLLIN)
+
+        try:
+            while not self.__is_done():
+                events = dict(poller.poll(poll_timeout))
+                if self.__isocket in events:
+                    self.__wsocket.send_multipart(self.__isocket.recv_multipart())
+                if self.__wsocket in events:
+                    self.__isocket.send_multipart(self.__wsocket.recv_multipart())
 
         except KeyboardInterrupt:
             self.stop()
@@ -183,18 +245,22 @@ class Server(Loggable):
             self.info("Stopping polling")
             self.__done = True
 
-        with self.__ilock:
-            iaddr = self.__isocket.last_endpoint.decode()
-            self.info(f"Unbinding interactive socket from {iaddr}")
-            self.__isocket.unbind(iaddr)
+        self.__listen_thread.join()
+        for worker in self.__workers:
+            worker.join()
+        self.__workers.clear()
+
+        # The listening thread is gone, so nothing else uses these sockets
+        iaddr = self.__isocket.last_endpoint.decode()
+        self.info(f"Unbinding interactive socket from {iaddr}")
+        self.__isocket.unbind(iaddr)
+        self.__wsocket.unbind(self.__waddr)
 
         with self.__block:
             baddr = self.__bsocket.last_endpoint.decode()
             self.info("Unbinding broadcast socket from {}".format(baddr))
             self.__bsocket.unbind(baddr)
 
-        self.__listen_thread.join()
-
         self.info("Server stopped")
 
 
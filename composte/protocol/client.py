@@ -1,23 +1,27 @@
 """Client serialization protocol."""
-import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Union
 
+from protocol import codec
 from protocol.base.exceptions import DeserializationFailure
 
 
-def serialize(function_name: str, *args: List[str]) -> str:
+def serialize(
+    function_name: str, *args: List[Any], encoding: str = codec.JSON
+) -> Union[str, bytes]:
     """
     Serialize a message to be sent from client to server.
 
     function_name =:= type(str)
-    args =:= type(list of str)
+    args =:= type(list of str), unless the encoding keeps native types
     """
-    rpc = {"fName": function_name, "args": [str(arg) for arg in args]}
+    if encoding == codec.JSON:
+        args = [codec.legacyArgument(arg) for arg in args]
+    rpc = {"fName": function_name, "args": list(args)}
 
-    return json.dumps(rpc)
+    return codec.encode(rpc, encoding)
 
 
-def deserialize(msg: str) -> Dict[str, Any]:
+def deserialize(msg: Union[str, bytes]) -> Dict[str, Any]:
     """
     Deserialize a message received from a client as a dictionary.
 
@@ -26,7 +30,10 @@ def deserialize(msg: str) -> Dict[str, Any]:
         "args": [str()]
     }
     """
-    pythonObject = json.loads(msg)
+    try:
+        pythonObject = codec.decode(msg)
+    except ValueError:
+        raise DeserializationFailure("Received malformed data: {}".format(msg))
     if type(pythonObject) != dict:
         raise DeserializationFailure("Received malformed data: {}".format(msg))
     return pythonObject
@@ -0,0 +1,87 @@
+"""
+Encodings of messages on the wire.
+
+Messages are either JSON or msgpack documents. JSON is the fallback that
+every client and server understands, and turns every argument of a message
+into a string. msgpack keeps arguments as they are, so nested arguments, like
+the arguments of an update, are neither encoded twice nor parsed twice.
+
+Which encoding a client uses is settled by the handshake. Every message can
+be told apart by its first byte, so servers answer each request in kind.
+Broadcasts go out once per encoding in use, each under its own topic.
+"""
+import json
+from typing import Any, List, Sequence, Union
+
+try:
+    import msgpack
+except ImportError:  # JSON will have to do
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def available() -> List[str]:
+    """List the encodings we can speak, most preferred first."""
+    if msgpack is None:
+        return [JSON]
+    return [MSGPACK, JSON]
+
+
+def negotiate(offered: Sequence[str]) -> str:
+    """Pick the encoding to use out of those offered by the other end."""
+    for name in available():
+        if name in offered:
+            return name
+    return JSON
+
+
+# Our msgpack messages are always maps or arrays, which start with one of
+# these bytes. None of them can start a JSON document
+_MSGPACK_HEADERS = frozenset(range(0x80, 0xA0)) | {0xDC, 0xDD, 0xDE, 0xDF}
+
+
+def detect(message: Union[str, bytes]) -> str:
+    """
+    Tell which encoding a message is in.
+
+    Anything that isn't msgpack is taken to be JSON, including plain text
+    like the failure messages of the network layer, which then fails to
+    decode.
+    """
+    if isinstance(message, bytes) and message[:1] and message[0] in _MSGPACK_HEADERS:
+        return MSGPACK
+    return JSON
+
+
+def encode(obj: Any, name: str) -> Union[str, bytes]:
+    """Encode obj in the named encoding, stringifying anything unknown."""
+    if name == MSGPACK:
+        return msgpack.packb(obj, default=str, use_bin_type=True)
+    return json.dumps(obj, default=str)
+
+
+def decode(message: Union[str, bytes]) -> Any:
+    """
+    Decode a message in whichever encoding it is in.
+
+    Raises ValueError if the message is malformed.
+    """
+    if detect(message) == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Received msgpack without msgpack installed")
+        return msgpack.unpackb(message, raw=False)
+    return json.loads(message)
+
+
+def legacyArgument(arg: Any) -> str:
+    """Turn an argument into a string, the way JSON messages carry them."""
+    if isinstance(arg, (list, tuple, dict)):
+        return json.dumps(arg, default=str)
+    return str(arg)
+
+
+def topic(project_id: str, name: str) -> str:
+    """Name the topic that updates to a project are broadcast under."""
+    return "{}/{}".format(project_id, name)
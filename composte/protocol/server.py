@@ -1,20 +1,28 @@
 """Server serialization protocol."""
-import json
-from typing import Any, List
+from typing import Any, List, Union
 
+from protocol import codec
 from protocol.base.exceptions import DeserializationFailure
 
 
-def serialize(status: str, *args: List[Any]) -> str:
-    """Serialize messages sent to clients from the server as a list."""
-    return json.dumps([status, [str(arg) for arg in args]])
+def serialize(
+    status: str, *args: List[Any], encoding: str = codec.JSON
+) -> Union[str, bytes]:
+    """
+    Serialize messages sent to clients from the server as a list.
 
+    Arguments are stringified under JSON, and kept as they are otherwise.
+    """
+    if encoding == codec.JSON:
+        args = [codec.legacyArgument(arg) for arg in args]
+    return codec.encode([status, list(args)], encoding)
 
-def deserialize(msg: str) -> List[Any]:
+
+def deserialize(msg: Union[str, bytes]) -> List[Any]:
     """Deserialize a message received from a server as a list."""
     try:
-        pythonObject = json.loads(msg)
-    except json.decoder.JSONDecodeError:
+        pythonObject = codec.decode(msg)
+    except ValueError:
         return ["fail", msg]
     if type(pythonObject) != list:
         raise DeserializationFailure("Received malformed data: {}".format(msg))
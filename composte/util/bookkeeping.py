@@ -1,4 +1,8 @@
 """Bookkeeping functions."""
+import time
+from collections import OrderedDict
+from threading import Lock, RLock
+from typing import Any, Callable, Dict, Optional
 
 
 class Pool:
@@ -48,58 +52,239 @@ class ProjectPool:
     Pool Composte projects in memory.
 
     uuid -> (project, count)
-    """
 
-    __objects = {}
+    Projects stay cached after their count drops to zero, and are evicted
+    least recently used first once the pool holds more than max_projects
+    projects, or more than an estimated max_bytes bytes as measured by sizeof.
+    Projects that are in use are never evicted, and neither are projects with
+    unflushed changes until they have been flushed.
 
-    def __init__(self):
+    Projects with changes that have not yet been written to backend storage
+    are tracked separately, along with when they first became dirty.
+
+    uuid -> time
+
+    With max_bytes set, the size of each project is measured when it is
+    cached and again whenever a reference to it is removed, and the pool
+    keeps a running total of those sizes.
+
+    uuid -> bytes
+    """
+
+    def __init__(
+        self,
+        max_projects: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda proj: 0,
+    ):
         """Initialize the project pool."""
-        pass
+        self.__objects = OrderedDict()
+        self.__dirty = {}
+        self.__lock = RLock()
+
+        self.__max_projects = max_projects
+        self.__max_bytes = max_bytes
+        self.__sizeof = sizeof
+        self.__sizes = {}
+        self.__bytes = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
 
     def put(self, uuid, constructor=None):
         """
         Fetch a project and bump its refcount.
 
         When the requested project is not cached,
-        invoke constructor if possible and cache the result.
+        invoke constructor if possible and cache the result. A constructor
+        that returns None, or raises, leaves nothing cached.
         """
-        (proj, count) = ProjectPool.__objects.get(uuid, (None, 0))
+        with self.__lock:
+            (proj, count) = self.__objects.get(uuid, (None, 0))
+            if proj is not None:
+                self.__hits += 1
+                self.__objects[uuid] = (proj, count + 1)
+                self.__objects.move_to_end(uuid)
+                return proj
 
-        if proj is None:
+            self.__misses += 1
             if constructor is None:
                 # We don't have it and the client is going to go get it
                 return None
-            else:
-                # We don't have it but the client told us how to get it
-                proj = constructor()
 
-        ProjectPool.__objects[uuid] = (proj, count + 1)
-        return proj
+        # We don't have it but the client told us how to get it. Building a
+        # project can be slow, so don't hold up the rest of the pool meanwhile
+        built = constructor()
+        if built is None:
+            return None
+        size = self.__measure(built)
+
+        with self.__lock:
+            # Somebody else may have beaten us to it
+            if uuid not in self.__objects:
+                self.__sizes[uuid] = size
+                self.__bytes += size
+            (proj, count) = self.__objects.get(uuid, (built, 0))
+            self.__objects[uuid] = (proj, count + 1)
+            self.__objects.move_to_end(uuid)
+            self.__evict_clean()
+            return proj
 
     def remove(self, uuid, on_removal=lambda x: x):
         """
         Un-use a project.
 
-        Runs on_removal with the project as an argument when the reference is removed.
+        Runs on_removal with the project as an argument when the last
+        reference is removed. The project itself stays cached until evicted.
         """
-        (proj, count) = ProjectPool.__objects.get(uuid, (None, 0))
+        with self.__lock:
+            (proj, count) = self.__objects.get(uuid, (None, 0))
 
-        if count is None:
-            return
+            if proj is None or count == 0:
+                return
 
-        if count > 1:
-            ProjectPool.__objects[uuid] = (proj, count - 1)
-        elif count == 1:
+            self.__objects[uuid] = (proj, count - 1)
+
+        # Whoever is done with the project may well have changed its size
+        size = self.__measure(proj)
+        with self.__lock:
+            if uuid in self.__sizes:
+                self.__bytes += size - self.__sizes[uuid]
+                self.__sizes[uuid] = size
+
+        if count == 1:
             on_removal(proj)
-            del ProjectPool.__objects[uuid]
 
         return count - 1
 
+    def mark_dirty(self, uuid):
+        """Record that a project has changes that have not been flushed."""
+        with self.__lock:
+            self.__dirty.setdefault(uuid, time.monotonic())
+
+    def mark_clean(self, uuid):
+        """Record that all changes to a project have been flushed."""
+        with self.__lock:
+            self.__dirty.pop(uuid, None)
+
+    def is_dirty(self, uuid) -> bool:
+        """Check whether a project has changes that have not been flushed."""
+        with self.__lock:
+            return uuid in self.__dirty
+
     def map(self, mapfun):
         """
         Apply a function to all cached projects.
 
-        Adding or removing projects during this process results in undefined behavior.
+        Works on a snapshot of the pool, so projects added or removed while
+        this runs may or may not be visited.
         """
-        for pid, (proj, count) in ProjectPool.__objects.items():
+        with self.__lock:
+            objects = list(self.__objects.items())
+
+        for pid, (proj, count) in objects:
             mapfun(proj, count)
+
+    def map_dirty(self, mapfun, max_age=0):
+        """
+        Apply a function to cached projects that have been dirty for a while.
+
+        Only projects that first became dirty at least max_age seconds ago are
+        visited, so that busy projects are not written out after every edit.
+        Like map, this works on a snapshot of the pool.
+        """
+        with self.__lock:
+            dirty = list(self.__dirty.items())
+
+        now = time.monotonic()
+        for pid, since in dirty:
+            if now - since < max_age:
+                continue
+            with self.__lock:
+                (proj, count) = self.__objects.get(pid, (None, 0))
+            if proj is not None:
+                mapfun(proj, count)
+
+    def evict(self, flush):
+        """
+        Evict unused projects until the pool is back within budget.
+
+        Dirty projects are passed to flush, which is expected to write them out
+        and mark them clean, before they are evicted. Call this from somewhere
+        that does not hold any project locks.
+        """
+        with self.__lock:
+            if not self.__over_budget():
+                return
+            candidates = [
+                (pid, proj)
+                for pid, (proj, count) in self.__objects.items()
+                if count == 0 and pid in self.__dirty
+            ]
+
+        for pid, proj in candidates:
+            flush(proj, 0)
+            with self.__lock:
+                self.__evict_clean()
+                if not self.__over_budget():
+                    return
+
+    def __over_budget(self) -> bool:
+        if self.__max_projects is not None:
+            if len(self.__objects) > self.__max_projects:
+                return True
+        if self.__max_bytes is not None:
+            if self.__bytes > self.__max_bytes:
+                return True
+        return False
+
+    def __measure(self, proj) -> int:
+        """Measure a project, unless nobody cares how big projects are."""
+        if self.__max_bytes is None:
+            return 0
+        return self.__sizeof(proj)
+
+    def __evict_clean(self):
+        """Evict unused projects with no unflushed changes, oldest first."""
+        for pid, (proj, count) in list(self.__objects.items()):
+            if not self.__over_budget():
+                return
+            if count == 0 and pid not in self.__dirty:
+                del self.__objects[pid]
+                self.__bytes -= self.__sizes.pop(pid)
+                self.__evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Report how well the pool is doing."""
+        with self.__lock:
+            return {
+                "projects": len(self.__objects),
+                "dirty": len(self.__dirty),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+            }
+
+
+class LockPool:
+    """
+    Hand out one lock per tag, so that unrelated things need not wait on each other.
+
+    Locks are created on first use and are reentrant, so code that already
+    holds the lock for a tag may safely ask for it again.
+    """
+
+    def __init__(self):
+        """Initialize the lock pool."""
+        self.__locks = {}
+        self.__lock = Lock()
+
+    def get(self, tag) -> RLock:
+        """Fetch the lock for tag, creating it if necessary."""
+        with self.__lock:
+            lock = self.__locks.get(tag, None)
+            if lock is None:
+                lock = RLock()
+                self.__locks[tag] = lock
+            return lock
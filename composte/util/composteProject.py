@@ -2,11 +2,153 @@
 import base64
 import json
 import uuid
-from typing import Any, Dict, List, Optional, Tuple
+from collections.abc import MutableSequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import music21
 
 from composte.network.base.exceptions import GenericError
+from composte.util import scoreCodec
+
+
+class _Part:
+    """A part, in whichever of its forms are on hand."""
+
+    __slots__ = ("part", "text", "stored")
+
+    def __init__(self, part=None, text=None, stored=None):
+        # The thawed music21 stream, once something has asked for it
+        self.part = part
+        # The base64 text of the frozen part, while it is up to date
+        self.text = text
+        # The name the part is stored under, while it is up to date
+        self.stored = stored
+
+
+class LazyParts(MutableSequence):
+    """
+    The parts of a project, each of which is only thawed when first used.
+
+    Parts that have come out of storage are kept as the base64 text of their
+    frozen form until something indexes or iterates over them, at which point
+    they are thawed for good. Parts keep their frozen text, and the name they
+    are stored under, until markChanged says otherwise, so unchanged parts
+    never need to be frozen again.
+
+    Anything that modifies a part in place must call markChanged.
+    """
+
+    def __init__(
+        self,
+        parts: Sequence[Union[str, music21.stream.Stream]] = (),
+        stored: Optional[Sequence[Optional[str]]] = None,
+    ):
+        """
+        Initialize the parts.
+
+        Each part is either a music21 stream, or the base64 text of a frozen
+        part, as produced by freezePart. stored, if given, holds the name that
+        each part is stored under.
+        """
+        if stored is None:
+            stored = [None] * len(parts)
+        self.__parts = [self.__wrap(part) for part in parts]
+        for (entry, name) in zip(self.__parts, stored):
+            entry.stored = name
+
+    @staticmethod
+    def __wrap(part) -> _Part:
+        if isinstance(part, str):
+            return _Part(text=part)
+        return _Part(part=part)
+
+    def __thaw(self, index: int) -> music21.stream.Stream:
+        entry = self.__parts[index]
+        if entry.part is None:
+            entry.part = thawPart(base64.b64decode(entry.text.encode()))
+        return entry.part
+
+    def __getitem__(self, index):
+        """Retrieve a part, thawing it if need be."""
+        if isinstance(index, slice):
+            return [self.__thaw(i) for i in range(*index.indices(len(self)))]
+        return self.__thaw(index)
+
+    def __setitem__(self, index, part) -> None:
+        """Replace a part."""
+        self.__parts[index] = self.__wrap(part)
+
+    def __delitem__(self, index) -> None:
+        """Remove a part without bothering to thaw it."""
+        del self.__parts[index]
+
+    def __len__(self) -> int:
+        """Count the parts, thawed or not."""
+        return len(self.__parts)
+
+    def insert(self, index: int, part) -> None:
+        """Insert a part before index."""
+        self.__parts.insert(index, self.__wrap(part))
+
+    def swap(self, first: int, second: int) -> None:
+        """Swap two parts without bothering to thaw them."""
+        (self.__parts[first], self.__parts[second]) = (
+            self.__parts[second],
+            self.__parts[first],
+        )
+
+    def isThawed(self, index: int) -> bool:
+        """Tell whether a part has been thawed."""
+        return self.__parts[index].part is not None
+
+    def markChanged(self, index: Optional[int] = None) -> None:
+        """
+        Note that a part has been modified.
+
+        With index None, every part that has been thawed is taken to have been
+        modified. Parts that were never thawed can't have been.
+        """
+        if index is None:
+            entries = [entry for entry in self.__parts if entry.part is not None]
+        else:
+            entries = [self.__parts[index]]
+        for entry in entries:
+            if entry.part is None:
+                # Modified parts must be thawed to be frozen again
+                entry.part = thawPart(base64.b64decode(entry.text.encode()))
+            entry.text = None
+            entry.stored = None
+
+    def frozenPart(self, index: int) -> str:
+        """Freeze a part to base64 text, unless it already is."""
+        entry = self.__parts[index]
+        if entry.text is None:
+            entry.text = base64.b64encode(freezePart(entry.part)).decode()
+        return entry.text
+
+    def frozen(self) -> List[str]:
+        """Freeze every part to base64 text, reusing the text of unchanged parts."""
+        return [self.frozenPart(i) for i in range(len(self))]
+
+    def storedNames(self) -> List[Optional[str]]:
+        """List the names parts are stored under, or None for unstored parts."""
+        return [entry.stored for entry in self.__parts]
+
+    def markStored(self, index: int, name: str) -> None:
+        """Note that a part is now stored under name."""
+        self.__parts[index].stored = name
+
+    def approximateSize(self) -> int:
+        """
+        Very roughly estimate how many bytes of memory the parts take up.
+
+        Frozen text takes up about as much as its length.
+        """
+        return sum(
+            (len(entry.text) if entry.text is not None else 0)
+            + (len(entry.part) * 2048 if entry.part is not None else 0)
+            for entry in self.__parts
+        )
 
 
 class ComposteProject:
@@ -15,8 +157,9 @@ class ComposteProject:
     def __init__(
         self,
         metadata: Dict[str, Any],
-        parts: Optional[List[music21.part.Part]] = None,
+        parts: Optional[Sequence[music21.stream.Stream]] = None,
         project_id: Optional[uuid.UUID] = None,
+        version: int = 0,
     ):
         """
         Initialize the Project.
@@ -25,11 +168,15 @@ class ComposteProject:
             - An empty stream
             - A list of subscribers consisting solely of the owner
             - A dictionary of metadata about the score
+            - A version number, bumped by the server for every update applied
         """
         self.metadata = metadata
+        self.version = version
 
-        if parts is not None:
+        if isinstance(parts, LazyParts):
             self.parts = parts
+        elif parts is not None:
+            self.parts = LazyParts(parts)
         else:
             s = music21.stream.Stream()
             s.insert(0.0, music21.key.KeySignature(0))
@@ -37,7 +184,7 @@ class ComposteProject:
             s.insert(0.0, music21.tempo.MetronomeMark("", 120, 1.0))
             s.insert(0.0, music21.clef.clefFromString("treble"))
             s.insert(0.0, music21.instrument.fromString("piano"))
-            self.parts = [s]
+            self.parts = LazyParts([s])
         if project_id is not None:
             self.project_id = project_id
         else:
@@ -46,7 +193,7 @@ class ComposteProject:
     def addPart(self) -> None:
         """Add a new part to a project."""
         s = music21.stream.Stream()
-        s.insert(0.0, music21.key.keySignature(0))
+        s.insert(0.0, music21.key.KeySignature(0))
         s.insert(0.0, music21.meter.TimeSignature("4/4"))
         s.insert(0.0, music21.tempo.MetronomeMark("", 120, 1.0))
         s.insert(0.0, music21.clef.clefFromString("treble"))
@@ -65,9 +212,7 @@ class ComposteProject:
         are presented on the GUI. firstPart and secondPart are both 0-indexed.
         """
         if int(firstPart) < len(self.parts) and int(secondPart) < len(self.parts):
-            tmp = self.parts[firstPart]
-            self.parts[firstPart] = self.parts[secondPart]
-            self.parts[secondPart] = tmp
+            self.parts.swap(int(firstPart), int(secondPart))
         else:
             raise GenericError
 
@@ -78,28 +223,67 @@ class ComposteProject:
         else:
             raise GenericError
 
+    def approximateSize(self) -> int:
+        """
+        Very roughly estimate how many bytes of memory the project takes up.
+
+        Good enough to compare projects against each other, and not much else.
+        """
+        return self.parts.approximateSize()
+
     def serialize(self) -> Tuple[str, str, str]:
         """
         Construct three JSON objects representing the fields of a ComposteProject.
 
         Intended to be stored in three discrete database fields.
 
-        Returns a tuple containing the serialized JSON objects.
+        Returns a tuple containing the serialized JSON objects. The version
+        travels with the metadata.
         """
-        bits = [music21.converter.freezeStr(part) for part in self.parts]
-        bytes_ = [base64.b64encode(bit).decode() for bit in bits]
-        parts = json.dumps(bytes_)
-        metadata = json.dumps(self.metadata)
+        parts = json.dumps(self.parts.frozen())
+        metadata = self.serializeMetadata()
         uuid = str(self.project_id)
         return (metadata, parts, uuid)
 
+    def serializeMetadata(self, **extra: Any) -> str:
+        """Construct the JSON object for the metadata, with any extra fields."""
+        return json.dumps({**self.metadata, **extra, "version": self.version})
+
+
+def freezePart(part: music21.stream.Stream) -> bytes:
+    """
+    Convert a part to bytes.
+
+    Parts are encoded with scoreCodec where possible, and pickled otherwise.
+    """
+    try:
+        return scoreCodec.encodePart(part)
+    except scoreCodec.UnsupportedElement:
+        return music21.converter.freezeStr(part)
+
+
+def thawPart(bits: bytes) -> music21.stream.Stream:
+    """Convert bytes produced by freezePart, in either format, back to a part."""
+    if scoreCodec.isEncoded(bits):
+        return scoreCodec.decodePart(bits)
+    return music21.converter.thawStr(bits)
+
+
+def deserializeProject(
+    serializedProject: Tuple[str, str, str],
+    stored: Optional[Sequence[Optional[str]]] = None,
+) -> ComposteProject:
+    """
+    Deserialize a serialized music21 composteProject to a composteProject object.
 
-def deserializeProject(serializedProject: Tuple[str, str, str]) -> ComposteProject:
-    """Deserialize a serialized music21 composteProject to a composteProject object."""
+    Parts are left frozen until they are first used. stored, if given, holds
+    the names the parts are stored under.
+    """
     (metadata, parts, id_) = serializedProject
-    bits = json.loads(parts)
-    bytes_ = [base64.b64decode(bit.encode()) for bit in bits]
-    reconstructed_parts = [music21.converter.thawStr(byte) for byte in bytes_]
+    reconstructed_parts = LazyParts(json.loads(parts), stored)
     reconstructed_metadata = json.loads(metadata)
+    version = reconstructed_metadata.pop("version", 0)
     project_id = uuid.UUID(id_)
-    return ComposteProject(reconstructed_metadata, reconstructed_parts, project_id)
+    return ComposteProject(
+        reconstructed_metadata, reconstructed_parts, project_id, version
+    )
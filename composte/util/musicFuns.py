@@ -1,9 +1,14 @@
 """Manipulations on music21 objects."""
 
+from collections import namedtuple
 from typing import List
 
 import music21
 
+from composte.util import noteIndex, pitchEngine
+
+OffsetMap = namedtuple("OffsetMap", ["element", "offset", "endTime"])
+
 # TODO FOR FUTURE SELVES BEYOND COMP50:
 # Refactor projects and streams globally to obey a
 # Score > Part > Measure hierarchy
@@ -39,7 +44,7 @@ def changeKeySignature(offset, part, newSigSharps):
     as an integer. Negative numbers correspond to the number of flats.
     """
     newKeySig = music21.key.KeySignature(newSigSharps)
-    oldKeySigs = part.getKeySignatures()
+    oldKeySigs = list(part.getElementsByClass(music21.key.KeySignature))
     for i in range(len(oldKeySigs)):
         if oldKeySigs[i].offset == offset:
             part.replace(oldKeySigs[i], newKeySig)
@@ -65,51 +70,16 @@ def renameNotes(startOffset, part, keySig, endOffset=None):
     Rename all notes affected by a key signature change.
 
     We need to do this intelligently so as to not have sharp accidentals in a
-    flat key signature. Diffs need to accumulate while the renaming is in process.
+    flat key signature. Only the notes between startOffset and endOffset are
+    visited, and they are respelled where they stand, so the part itself
+    never needs to be rearranged.
     """
-    notes = part.notes
     hasSharps = 0 < keySig.sharps
-    for note in notes:
-        offset = note.offset
-        if endOffset is None:
-            if startOffset <= offset:
-                part.replace(note, renameNote(note, hasSharps))
-        else:
-            if startOffset <= offset and offset <= endOffset:
-                part.replace(note, renameNote(note, hasSharps))
-
-
-def renameNote(note: music21.note.Note, hasSharps: bool):
-    """Rename a note intelligently within a key."""
-    # Have to create a NEW Note object to use replace. Reasons unclear.
-    name = note.name
-    octave = note.octave
-    duration = note.duration
-    if hasSharps:
-        if name[1] == "-":
-            noteName = name[0]
-            if noteName == "A":
-                newName = "G"
-            else:
-                newName = chr(ord(noteName) - 1)
-            newName += "#"
-        else:
-            newName = name
-    else:
-        if name[1] == "#":
-            noteName = name[0]
-            if noteName == "G":
-                newName = "A"
-            else:
-                newName = chr(ord(noteName) + 1)
-            newName += "-"
-        else:
-            newName = name
-    return createNote(newName + str(octave), duration.quarterLength)
+    pitchEngine.respell(noteIndex.forPart(part).span(startOffset, endOffset), hasSharps)
 
 
 # NOT IN MINIMUM DELIVERABLE
-def changeTimeSignature(offset: float, part: music21.part.Part, newSigStr: str):
+def changeTimeSignature(offset: float, part: music21.stream.Part, newSigStr: str):
     """
     Change the Time Signature at a given offset inside a part.
 
@@ -126,7 +96,7 @@ def changeTimeSignature(offset: float, part: music21.part.Part, newSigStr: str):
 
 
 def insertMetronomeMark(
-    offset: float, parts: List[music21.part.Part], bpm: int
+    offset: float, parts: List[music21.stream.Part], bpm: int
 ) -> List[float]:
     """
     Insert a metronome marking in a list of parts at a given offset.
@@ -154,7 +124,7 @@ def insertMetronomeMark(
     return [offset, offset]
 
 
-def removeMetronomeMark(offset: float, parts: List[music21.part.Part]) -> List[float]:
+def removeMetronomeMark(offset: float, parts: List[music21.stream.Part]) -> List[float]:
     """Remove a metronome marking from all parts at a given offset."""
     for part in parts:
         markings = part.metronomeMarkBoundaries()
@@ -178,39 +148,40 @@ def insertNote(offset, part, pitchStr, duration):
     """Add a note at a given offset to a part."""
     newNote = createNote(pitchStr, duration)
     bounds = (offset, offset + duration)
-    notes = part.notes
+    index = noteIndex.forPart(part)
     maxLims = [None, None]
-    for note in notes:
+    for note in index.overlapping(*bounds):
         limits = (note.offset, note.duration.quarterLength + note.offset)
-        if bounds[0] < limits[1] and limits[0] < bounds[1]:
-            removeNote(note.offset, part, note.pitch.nameWithOctave)
-            if maxLims[0] is None and maxLims[1] is None:
-                maxLims = [limits[0], limits[1]]
-            else:
-                maxLims = [min(maxLims[0], limits[0]), max(maxLims[1], limits[1])]
+        removeNote(note.offset, part, note.pitch.nameWithOctave)
+        if maxLims[0] is None and maxLims[1] is None:
+            maxLims = [limits[0], limits[1]]
+        else:
+            maxLims = [min(maxLims[0], limits[0]), max(maxLims[1], limits[1])]
     if maxLims[0] is None and maxLims[1] is None:
         maxLims = [bounds[0], bounds[1]]
     else:
         maxLims = [min(maxLims[0], bounds[0]), max(maxLims[1], bounds[1])]
     part.insert(offset, newNote)
+    index.add(newNote, offset)
     return maxLims
 
 
 def removeNote(offset, part, removedNoteName):
     """Remove a note at a given offset into a part."""
-    notes = part.notes
+    index = noteIndex.forPart(part)
     maxLims = [offset, offset]
-    for note in notes:
-        noteName = note.pitch.nameWithOctave
-        if note.offset == offset and noteName == removedNoteName:
-            if note.tiePartners[0] is not None:
-                maxLims[0] = note.tiePartners[0]
-                updateTieStatus(note.tiePartners[0], part, noteName)
-            if note.tiePartners[1] is not None:
-                maxLims[1] = note.tiePartners[1]
-                updateTieStatus(offset, part, noteName)
-            part.remove(note)
-            return maxLims
+    note = index.find(offset, removedNoteName)
+    if note is None:
+        return maxLims
+
+    if note.tiePartners[0] is not None:
+        maxLims[0] = note.tiePartners[0]
+        updateTieStatus(note.tiePartners[0], part, removedNoteName)
+    if note.tiePartners[1] is not None:
+        maxLims[1] = note.tiePartners[1]
+        updateTieStatus(offset, part, removedNoteName)
+    part.remove(note)
+    index.remove(note, offset)
     return maxLims
 
 
@@ -222,19 +193,16 @@ def updateTieStatus(offset, part, noteName):
     FIRST note in a legally tie-able pair of notes (the notes
     must be the same pitch, and there must be no rests between them).
     """
-    notes = part.notes
-    for note in notes:
-        pitchStr = note.pitch.nameWithOctave
-        if note.offset == offset and pitchStr == noteName:
-            qL = note.duration.quarterLength
-            tieCantidates = part.getElementsByOffset(note.offset + qL)
-            for cantidate in tieCantidates:
-                if cantidate.pitch.nameWithOctave == noteName:
-                    makeTieUpdate([note, cantidate])
-                else:
-                    pass
-            return [offset, note.offset + qL]
-    return [offset, offset]
+    index = noteIndex.forPart(part)
+    note = index.find(offset, noteName)
+    if note is None:
+        return [offset, offset]
+
+    qL = note.duration.quarterLength
+    cantidate = index.find(offset + qL, noteName)
+    if cantidate is not None:
+        makeTieUpdate([note, cantidate])
+    return [offset, offset + qL]
 
 
 def add_ties(first_note: music21.note.Note, second_note: music21.note.Note) -> None:
@@ -305,8 +273,12 @@ def makeTieUpdate(notes):
 
 def transpose(part, semitones):
     """Transposes the whole part up or down by an integer number of semitones."""
-    part = part.transpose(semitones)
-    return [0.0, part.highestTime]
+    return pitchEngine.transpose(part, semitones)
+
+
+def transposeRange(startOffset, part, semitones, endOffset):
+    """Transpose the notes starting between two offsets by a number of semitones."""
+    return pitchEngine.transpose(part, semitones, startOffset, endOffset)
 
 
 def insertClef(offset, part, clefStr):
@@ -407,11 +379,9 @@ def removeDynamic(offset, part):
 
 def addLyric(offset, part, lyric):
     """Add lyrics to a given note in the score."""
-    notes = part.notes
-    for note in notes:
-        if note.offset == offset:
-            note.addLyric(lyric)
-            return [offset, offset]
+    for note in noteIndex.forPart(part).at(offset):
+        note.addLyric(lyric)
+        return [offset, offset]
     return [offset, offset]
 
 
@@ -428,6 +398,19 @@ def boundedOffset(part, bounds):
     - element is the music21 object to insert.
     - offset is the insertion offset of the music21 object.
     - endTime is the termination offset of the music21 object.
+
+    Only objects that begin at or after bounds[0], and before bounds[1], are
+    included.
     """
-    offs = part.offsetMap()
-    return [x for x in offs if bounds[0] <= x.offset and x.endTime < bounds[1]]
+    elements = part.getElementsByOffset(
+        bounds[0],
+        bounds[1],
+        includeEndBoundary=False,
+        mustBeginInSpan=True,
+        includeElementsThatEndAtStart=True,
+    )
+    offs = []
+    for element in elements:
+        offset = part.elementOffset(element)
+        offs.append(OffsetMap(element, offset, offset + element.quarterLength))
+    return offs
@@ -12,27 +12,29 @@ from typing import Any, Callable, List, Optional, Tuple
 import music21
 
 from composte.constants import LEGAL_NOTE_LENGTHS, MUSIC_FUN_LOOKUP_TABLE
-from network.base.exceptions import GenericError
+from composte.network.base.exceptions import GenericError
 
 
 def unpackFun(project, partIndex, fname, args):
     """
     Determine which function to call.
 
-    Casts all arguments to the correct types.
+    Casts the arguments of that function, and only that function, to the
+    correct types.
     """
+    try:
+        (function, decode) = MUSIC_FUN_LOOKUP_TABLE[fname]
+    except KeyError:
+        return (None, None)
+
     try:
         if partIndex is not None and partIndex != "None":
             musicObject = project.parts[int(partIndex)]
         else:
             musicObject = project.parts
 
-        return (
-            MUSIC_FUN_LOOKUP_TABLE(musicObject, args)[fname]
-            if fname in MUSIC_FUN_LOOKUP_TABLE
-            else (None, None)
-        )
-    except ValueError as e:
+        return (function, decode(musicObject, args))
+    except (ValueError, IndexError) as e:
         raise GenericError from e
 
 
@@ -59,12 +61,14 @@ def performMusicFun(
     Wrap all music functions.
 
     The name of the function to be called (as a string) is the first argument,
-    and the arguments to the function (as a list) is the second.
+    and the arguments to the function (as a list, or a JSON encoded list) is
+    the second.
     """
     # Fetch the project before anything else
     # for ease of use
     project = fetchProject(project_id)
-    args = json.loads(args)
+    if isinstance(args, str):
+        args = json.loads(args)
     if fname == "chat":
         return ("ok", "")  # Why not make a chat server too?
 
@@ -79,7 +83,58 @@ def performMusicFun(
         if unpacked[1][3] not in LEGAL_NOTE_LENGTHS:
             return ("fail", "INVALID NOTE LENGTH")
 
-    updateOffsets = update_project(unpacked)
+    try:
+        updateOffsets = update_project(unpacked)
+    finally:
+        # Even a failed update may have left its mark on the parts
+        if partIndex is not None and partIndex != "None":
+            project.parts.markChanged(int(partIndex))
+        else:
+            project.parts.markChanged()
 
     # End error handling
     return ("ok", updateOffsets)
+
+
+def performMusicFunBatch(project_id, operations, fetchProject=None, onApplied=None):
+    """
+    Wrap a batch of music functions, applying them in order.
+
+    operations is a list of [fname, args, partIndex, offset], each exactly as
+    it would be passed to performMusicFun. onApplied, if given, is called with
+    each operation once it has been applied successfully. The batch stops at
+    the first operation that fails.
+
+    Returns the range of offsets affected by the whole batch.
+    """
+    project = fetchProject(project_id)
+    if len(operations) == 0:
+        return ("fail", "EMPTY BATCH")
+
+    updateOffsets = None
+    for operation in operations:
+        (status, other) = performMusicFun(
+            project_id, *operation, fetchProject=lambda _: project
+        )
+        if status != "ok":
+            return (status, other)
+
+        if onApplied is not None:
+            onApplied(operation)
+
+        # Chat messages don't affect any offsets
+        if operation[0] == "chat":
+            continue
+
+        if updateOffsets is None:
+            updateOffsets = list(other)
+        else:
+            updateOffsets = [
+                min(updateOffsets[0], other[0]),
+                max(updateOffsets[1], other[1]),
+            ]
+
+    if updateOffsets is None:
+        return ("ok", "")
+
+    return ("ok", updateOffsets)
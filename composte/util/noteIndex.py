@@ -0,0 +1,101 @@
+"""
+An index of the notes in a part, ordered by offset.
+
+music21 streams can only be searched for notes by walking all of them, which
+makes every edit to a long part slow. The index keeps the notes of a part
+sorted by offset, so that looking up the notes at an offset, or the notes
+overlapping a range of offsets, is a binary search away.
+
+Indexes are built the first time they are asked for, and must be kept up to
+date by whatever adds notes to or removes notes from the part, or moves them
+within it. Parts that are replaced, or reloaded, are new streams, and get
+indexes of their own.
+"""
+import weakref
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from typing import List, Optional
+
+import music21
+
+
+class NoteIndex:
+    """The notes of a part, sorted by offset."""
+
+    def __init__(self, part: Optional[music21.stream.Stream] = None):
+        """Initialize an index of the notes in part."""
+        self.__offsets = []
+        self.__notes = []
+        # Notes can only overlap a range if they start less than this long
+        # before it
+        self.__longest = 0.0
+
+        if part is not None:
+            for note in part.notes:
+                self.add(note, part.elementOffset(note))
+
+    def __len__(self) -> int:
+        """Count the notes in the index."""
+        return len(self.__notes)
+
+    def add(self, note: music21.note.Note, offset: float) -> None:
+        """Add a note, found at offset in its part."""
+        i = bisect_right(self.__offsets, offset)
+        self.__offsets.insert(i, offset)
+        self.__notes.insert(i, note)
+        self.__longest = max(self.__longest, note.quarterLength)
+
+    def remove(self, note: music21.note.Note, offset: float) -> None:
+        """Remove a note, found at offset in its part."""
+        lo = bisect_left(self.__offsets, offset)
+        hi = bisect_right(self.__offsets, offset)
+        for i in range(lo, hi):
+            if self.__notes[i] is note:
+                del self.__offsets[i]
+                del self.__notes[i]
+                return
+
+    def at(self, offset: float) -> List[music21.note.Note]:
+        """Find the notes that start at offset."""
+        lo = bisect_left(self.__offsets, offset)
+        hi = bisect_right(self.__offsets, offset)
+        return self.__notes[lo:hi]
+
+    def find(self, offset: float, nameWithOctave: str) -> Optional[music21.note.Note]:
+        """Find a note with the given pitch that starts at offset."""
+        for note in self.at(offset):
+            if note.pitch.nameWithOctave == nameWithOctave:
+                return note
+        return None
+
+    def span(
+        self, start: float, end: Optional[float] = None
+    ) -> List[music21.note.Note]:
+        """Find the notes that start between start and end, inclusive."""
+        lo = bisect_left(self.__offsets, start)
+        hi = len(self.__offsets) if end is None else bisect_right(self.__offsets, end)
+        return self.__notes[lo:hi]
+
+    def overlapping(self, start: float, end: float) -> List[music21.note.Note]:
+        """Find the notes that sound at some point after start and before end."""
+        lo = bisect_right(self.__offsets, start - self.__longest)
+        hi = bisect_left(self.__offsets, end)
+        return [
+            self.__notes[i]
+            for i in range(lo, hi)
+            if start < self.__offsets[i] + self.__notes[i].quarterLength
+        ]
+
+
+_indexes = weakref.WeakKeyDictionary()
+_lock = Lock()
+
+
+def forPart(part: music21.stream.Stream) -> NoteIndex:
+    """Retrieve the index of a part, building it if need be."""
+    with _lock:
+        index = _indexes.get(part, None)
+        if index is None:
+            index = NoteIndex(part)
+            _indexes[part] = index
+        return index
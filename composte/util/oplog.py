@@ -0,0 +1,167 @@
+"""Append-only logs of the updates applied to projects."""
+import json
+import os
+from threading import Lock
+from typing import Any, List, Tuple
+
+
+class OperationLog:
+    """
+    Keep a log of accepted updates for every project.
+
+    Each project gets a file of its own under root, with one JSON object per
+    line:
+
+        {"version": int, "op": [fname, args, partIndex, offset]}
+
+    where version is the version of the project after op was applied.
+
+    Appends hit the file immediately, but are only fsynced every sync_every
+    appends or whenever sync() is called, so that a burst of updates shares
+    the cost of flushing to disk.
+
+    Compaction keeps the last retain operations around even once they are in
+    a snapshot, so that clients that fell slightly behind can catch up without
+    fetching the whole project.
+    """
+
+    __extension = ".log"
+
+    def __init__(self, root: str, sync_every: int = 32, retain: int = 256):
+        """Initialize the operation logs, which live in the directory root."""
+        self.__root = root
+        self.__sync_every = sync_every
+        self.__retain = retain
+
+        # pid -> open file
+        self.__files = {}
+        # Files with appends that have not been fsynced yet
+        self.__unsynced = set()
+        self.__appends = 0
+        self.__lock = Lock()
+
+        try:
+            os.makedirs(self.__root)
+        except FileExistsError:
+            pass
+
+    def __path(self, pid: str) -> str:
+        return os.path.join(self.__root, pid + self.__extension)
+
+    def __open(self, pid: str):
+        """
+        Open the log of a project for appending.
+
+        A partially written final line, as left behind by a crash, is cut off
+        first, so that appends don't get glued onto it.
+        """
+        path = self.__path(pid)
+        try:
+            with open(path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+        return open(path, "a")
+
+    def append(self, pid: str, version: int, op: List[Any]) -> None:
+        """Record that op was applied to a project, bringing it to version."""
+        line = json.dumps({"version": version, "op": op}) + "\n"
+
+        with self.__lock:
+            f = self.__files.get(pid, None)
+            if f is None:
+                f = self.__open(pid)
+                self.__files[pid] = f
+
+            f.write(line)
+            f.flush()
+            self.__unsynced.add(f)
+            self.__appends += 1
+
+            if self.__appends < self.__sync_every:
+                return
+            # Under the lock, so that compact() can't close these meanwhile
+            for f in self.__unsynced:
+                os.fsync(f.fileno())
+            self.__unsynced.clear()
+            self.__appends = 0
+
+    def sync(self) -> None:
+        """Make sure that every append so far has made it to disk."""
+        with self.__lock:
+            unsynced = list(self.__unsynced)
+            self.__unsynced.clear()
+            self.__appends = 0
+
+            for f in unsynced:
+                os.fsync(f.fileno())
+
+    def read(self, pid: str, since: int = 0) -> List[Tuple[int, List[Any]]]:
+        """
+        Retrieve the operations logged for a project after version since.
+
+        Returns a list of (version, op) pairs, oldest first. Lines that can't
+        be read, like a partially written one left behind by a crash, are
+        skipped.
+        """
+        try:
+            with open(self.__path(pid), "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                continue
+            if entry["version"] > since:
+                entries.append((entry["version"], entry["op"]))
+
+        return entries
+
+    def compact(self, pid: str, version: int) -> None:
+        """
+        Forget the operations logged for a project up to and including version.
+
+        Only call this once a snapshot of the project at version is safely in
+        backend storage. The most recent of the forgotten operations are kept
+        around regardless, for the benefit of read(pid, since).
+        """
+        with self.__lock:
+            f = self.__files.pop(pid, None)
+            if f is not None:
+                self.__unsynced.discard(f)
+                f.close()
+
+            entries = self.read(pid)
+            snapshotted = [entry for entry in entries if entry[0] <= version]
+            remaining = [entry for entry in entries if entry[0] > version]
+            if self.__retain > 0:
+                remaining = snapshotted[-self.__retain :] + remaining
+            path = self.__path(pid)
+
+            if not remaining:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return
+
+            with open(path + ".tmp", "w") as f:
+                for (version_, op) in remaining:
+                    f.write(json.dumps({"version": version_, "op": op}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+
+    def close(self) -> None:
+        """Sync and close every open log."""
+        self.sync()
+        with self.__lock:
+            for f in self.__files.values():
+                f.close()
+            self.__files.clear()
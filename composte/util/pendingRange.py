@@ -0,0 +1,55 @@
+"""
+A range of offsets waiting to be dealt with.
+
+Updates can arrive much faster than a score can be redrawn. Rather than
+redrawing once per update, the ranges they touch are merged into one, which
+stays pending until somebody takes it. Only the update that starts a new
+pending range needs to be announced; the rest are folded into it.
+"""
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+
+class PendingRange:
+    """The union of every range added since the range was last taken."""
+
+    def __init__(self):
+        """Start with nothing pending."""
+        self.__pending = None
+        self.__lock = Lock()
+        self.__added = 0
+        self.__started = 0
+
+    def add(self, startOffset: float, endOffset: float) -> bool:
+        """
+        Widen the pending range to cover startOffset to endOffset.
+
+        Returns True if nothing was pending before, in which case whoever
+        takes the range needs to be told about it.
+        """
+        with self.__lock:
+            self.__added += 1
+            if self.__pending is not None:
+                self.__pending = (
+                    min(self.__pending[0], startOffset),
+                    max(self.__pending[1], endOffset),
+                )
+                return False
+            self.__pending = (startOffset, endOffset)
+            self.__started += 1
+            return True
+
+    def take(self) -> Optional[Tuple[float, float]]:
+        """
+        Claim the pending range, leaving nothing pending.
+
+        Returns (startOffset, endOffset), or None if nothing was pending.
+        """
+        with self.__lock:
+            (pending, self.__pending) = (self.__pending, None)
+        return pending
+
+    def stats(self) -> Dict[str, int]:
+        """Count the ranges added, and how many of them started a new range."""
+        with self.__lock:
+            return {"added": self.__added, "started": self.__started}
@@ -0,0 +1,212 @@
+"""
+Bulk pitch operations on parts, vectorized with NumPy.
+
+Pitches are gathered into an array of MIDI numbers, worked on as a whole,
+spelled and written back to the notes they came from, in place. Nothing is
+copied: the notes stay where they are, and so does their entry in the note
+index.
+
+Respelling follows the same rule as key signature changes: notes under a key
+signature with sharps are spelled with sharps, and all others with flats.
+Transposed notes are spelled from their old spelling and the interval
+instead, and only swapped for their enharmonic when transposing them brought
+in an awkward accidental, or one against the key signature in effect.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import music21
+import numpy as np
+
+from composte.util import noteIndex
+
+# (step, accidental) of each pitch class, spelled with sharps or with flats
+_SHARP_SPELLINGS = [
+    ("C", None),
+    ("C", "sharp"),
+    ("D", None),
+    ("D", "sharp"),
+    ("E", None),
+    ("F", None),
+    ("F", "sharp"),
+    ("G", None),
+    ("G", "sharp"),
+    ("A", None),
+    ("A", "sharp"),
+    ("B", None),
+]
+_FLAT_SPELLINGS = [
+    ("C", None),
+    ("D", "flat"),
+    ("D", None),
+    ("E", "flat"),
+    ("E", None),
+    ("F", None),
+    ("G", "flat"),
+    ("G", None),
+    ("A", "flat"),
+    ("A", None),
+    ("B", "flat"),
+    ("B", None),
+]
+
+# Semitones above C of each step, and the accidental for each alteration
+_STEP_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_ACCIDENTALS = {-2: "double-flat", -1: "flat", 0: None, 1: "sharp", 2: "double-sharp"}
+
+_LOWEST_MIDI = 0
+_HIGHEST_MIDI = 127
+
+
+def midiNumbers(notes: Sequence[music21.note.Note]) -> np.ndarray:
+    """Gather the MIDI numbers of notes into an array."""
+    return np.fromiter((note.pitch.midi for note in notes), np.int16, len(notes))
+
+
+def alters(notes: Sequence[music21.note.Note]) -> np.ndarray:
+    """Gather the alterations, in semitones, of notes into an array."""
+    return np.fromiter((note.pitch.alter for note in notes), np.float32, len(notes))
+
+
+def writePitches(
+    notes: Sequence[music21.note.Note], midi: np.ndarray, hasSharps: np.ndarray
+) -> None:
+    """
+    Set the pitch of each note to the matching MIDI number, in place.
+
+    hasSharps says, note by note, whether to spell with sharps or flats.
+    """
+    pitchClasses = (midi % 12).tolist()
+    octaves = (midi // 12 - 1).tolist()
+    for (note, pitchClass, octave, sharps) in zip(
+        notes, pitchClasses, octaves, hasSharps.tolist()
+    ):
+        spellings = _SHARP_SPELLINGS if sharps else _FLAT_SPELLINGS
+        (step, accidental) = spellings[pitchClass]
+        pitch = note.pitch
+        pitch.step = step
+        pitch.accidental = accidental
+        pitch.octave = octave
+        pitch.spellingIsInferred = False
+
+
+def _isAwkward(pitch: music21.pitch.Pitch) -> bool:
+    """Tell whether a pitch is spelled as a double accidental, or like E# or F-."""
+    return 1 < abs(pitch.alter) or (
+        pitch.alter != 0 and pitch.simplifyEnharmonic().alter == 0
+    )
+
+
+def _transposedSpelling(
+    pitch: music21.pitch.Pitch, interval: music21.interval.Interval, keySign: int
+) -> Tuple[str, int]:
+    """Spell a pitch transposed by an interval, as (step, alteration)."""
+    transposed = interval.transposePitch(pitch)
+    # Anything already spelled awkwardly or against the key was spelled that
+    # way on purpose, so only undo what the transposition brought in
+    if _isAwkward(transposed) and not _isAwkward(pitch):
+        transposed = transposed.simplifyEnharmonic()
+    if transposed.alter * keySign < 0 <= pitch.alter * keySign:
+        transposed = transposed.getEnharmonic()
+    return (transposed.step, int(transposed.alter))
+
+
+def writeTransposed(
+    notes: Sequence[music21.note.Note],
+    midi: np.ndarray,
+    semitones: int,
+    keySigns: np.ndarray,
+) -> None:
+    """
+    Set the pitch of each note to the matching MIDI number, in place.
+
+    Each note is spelled as its old spelling transposed by semitones.
+    keySigns says, note by note, whether the key signature in effect has
+    sharps (1), flats (-1) or neither (0).
+    """
+    # A bare number of semitones respells as it pleases, so name the interval
+    interval = music21.interval.Interval(
+        music21.interval.Interval(semitones).directedName
+    )
+    # Spelling only depends on these, so most notes share one
+    spellings: Dict[Tuple[str, float, int], Tuple[str, int]] = {}
+    for (note, number, keySign) in zip(notes, midi.tolist(), keySigns.tolist()):
+        pitch = note.pitch
+        key = (pitch.step, pitch.alter, keySign)
+        if key not in spellings:
+            spellings[key] = _transposedSpelling(pitch, interval, keySign)
+        (step, alter) = spellings[key]
+        pitch.step = step
+        pitch.accidental = _ACCIDENTALS[alter]
+        # B#3 and C4 are both MIDI 60, so the octave follows from the spelling
+        pitch.octave = (number - _STEP_SEMITONES[step] - alter) // 12 - 1
+        pitch.spellingIsInferred = False
+
+
+def keySigns(part: music21.stream.Stream, offsets: np.ndarray) -> np.ndarray:
+    """
+    Tell, for each offset, which way the key signature in effect goes.
+
+    That is 1 for a key signature with sharps, -1 for one with flats and 0
+    for one with neither, or for no key signature at all.
+    """
+    keySigs = list(part.getElementsByClass(music21.key.KeySignature))
+    if not keySigs:
+        return np.zeros(len(offsets), dtype=np.int8)
+
+    keyOffsets = np.array([part.elementOffset(keySig) for keySig in keySigs])
+    keySharps = np.sign([keySig.sharps for keySig in keySigs]).astype(np.int8)
+    # Notes before the first key signature fall under it anyway
+    governing = np.maximum(np.searchsorted(keyOffsets, offsets, side="right") - 1, 0)
+    return keySharps[governing]
+
+
+def transpose(
+    part: music21.stream.Stream,
+    semitones: int,
+    startOffset: float = 0.0,
+    endOffset: Optional[float] = None,
+) -> List[float]:
+    """
+    Transpose the notes starting between startOffset and endOffset, in place.
+
+    Returns the range of offsets covered by the notes that were transposed.
+    """
+    notes = noteIndex.forPart(part).span(startOffset, endOffset)
+    if not notes:
+        return [startOffset, startOffset if endOffset is None else endOffset]
+
+    midi = midiNumbers(notes) + semitones
+    if midi.min() < _LOWEST_MIDI or _HIGHEST_MIDI < midi.max():
+        raise music21.pitch.PitchException("Transposed out of range")
+
+    offsets = np.fromiter(
+        (part.elementOffset(note) for note in notes), np.float64, len(notes)
+    )
+    ends = offsets + np.fromiter(
+        (note.quarterLength for note in notes), np.float64, len(notes)
+    )
+    writeTransposed(notes, midi, semitones, keySigns(part, offsets))
+    return [float(offsets.min()), float(ends.max())]
+
+
+def respell(notes: Sequence[music21.note.Note], hasSharps: bool) -> None:
+    """
+    Respell notes with accidentals that go against a key signature, in place.
+
+    Sharpened notes are respelled as flats under a key signature without
+    sharps, and flattened notes as sharps under one with sharps.
+    """
+    if not notes:
+        return
+
+    wrong = alters(notes) == (-1 if hasSharps else 1)
+    (indices,) = np.nonzero(wrong)
+    if len(indices) == 0:
+        return
+
+    respelled = [notes[i] for i in indices.tolist()]
+    writePitches(
+        respelled,
+        midiNumbers(respelled),
+        np.full(len(respelled), hasSharps, dtype=bool),
+    )
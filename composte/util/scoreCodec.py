@@ -0,0 +1,205 @@
+"""
+A compact binary encoding of the parts of a Composte project.
+
+Only the elements that Composte actually edits are supported: notes (along
+with their ties and lyrics), clefs, key and time signatures, metronome marks,
+instruments and dynamics. Anything else is refused rather than dropped, so
+that callers can fall back to pickling the part.
+
+An encoded part is laid out as:
+
+    magic (4 bytes) | format version (u8) | element count (u32) | elements
+
+and every element as:
+
+    tag (1 byte) | offset (f64) | tag-specific payload
+
+Strings are UTF-8 with a u16 length prefix. All integers and floats are
+little-endian.
+"""
+import math
+import struct
+from typing import Callable, Dict, Tuple
+
+import music21
+
+MAGIC = b"CPSC"
+VERSION = 1
+
+_header = struct.Struct("<4sBI")
+_element = struct.Struct("<cd")
+_note = struct.Struct("<dBddB")
+_metronome = struct.Struct("<dd")
+
+_tie_types = [None, "start", "stop", "continue"]
+
+
+class UnsupportedElement(ValueError):
+    """Raise when a part holds something that this format can't represent."""
+
+
+def isEncoded(data: bytes) -> bool:
+    """Tell whether data looks like a part encoded by encodePart."""
+    return data[: len(MAGIC)] == MAGIC
+
+
+def _packString(string: str) -> bytes:
+    raw = string.encode()
+    return struct.pack("<H", len(raw)) + raw
+
+
+def _unpackString(data: bytes, at: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("<H", data, at)
+    at += 2
+    return (data[at : at + length].decode(), at + length)
+
+
+def _orNaN(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _orNone(value: float):
+    return None if math.isnan(value) else value
+
+
+def _encodeNote(note: music21.note.Note) -> bytes:
+    tiePartners = getattr(note, "tiePartners", [None, None])
+    tieType = None if note.tie is None else note.tie.type
+    lyrics = [lyric.text or "" for lyric in note.lyrics]
+    return (
+        _packString(note.nameWithOctave)
+        + _note.pack(
+            note.quarterLength,
+            _tie_types.index(tieType),
+            _orNaN(tiePartners[0]),
+            _orNaN(tiePartners[1]),
+            len(lyrics),
+        )
+        + b"".join(_packString(lyric) for lyric in lyrics)
+    )
+
+
+def _decodeNote(data: bytes, at: int):
+    (pitch, at) = _unpackString(data, at)
+    (quarterLength, tieType, before, after, nlyrics) = _note.unpack_from(data, at)
+    at += _note.size
+
+    note = music21.note.Note(pitch)
+    note.duration = music21.duration.Duration(quarterLength)
+    note.tiePartners = [_orNone(before), _orNone(after)]
+    if _tie_types[tieType] is not None:
+        note.tie = music21.tie.Tie(_tie_types[tieType])
+    for _ in range(nlyrics):
+        (lyric, at) = _unpackString(data, at)
+        note.addLyric(lyric)
+    return (note, at)
+
+
+def _encodeMetronome(mark: music21.tempo.MetronomeMark) -> bytes:
+    return _metronome.pack(mark.number, mark.referent.quarterLength) + _packString(
+        mark.text or ""
+    )
+
+
+def _decodeMetronome(data: bytes, at: int):
+    (number, referent) = _metronome.unpack_from(data, at)
+    (text, at) = _unpackString(data, at + _metronome.size)
+    return (music21.tempo.MetronomeMark(text, number, referent), at)
+
+
+def _encodeInstrument(instrument: music21.instrument.Instrument) -> bytes:
+    return _packString(type(instrument).__name__) + _packString(
+        instrument.instrumentName or ""
+    )
+
+
+def _decodeInstrument(data: bytes, at: int):
+    (className, at) = _unpackString(data, at)
+    (name, at) = _unpackString(data, at)
+    instrument = getattr(music21.instrument, className)()
+    instrument.instrumentName = name or None
+    return (instrument, at)
+
+
+def _decodeClef(data: bytes, at: int):
+    (className, at) = _unpackString(data, at)
+    return (getattr(music21.clef, className)(), at)
+
+
+def _decodeKeySignature(data: bytes, at: int):
+    (sharps,) = struct.unpack_from("<b", data, at)
+    return (music21.key.KeySignature(sharps), at + 1)
+
+
+def _decodeTimeSignature(data: bytes, at: int):
+    (ratio, at) = _unpackString(data, at)
+    return (music21.meter.TimeSignature(ratio), at)
+
+
+def _decodeDynamic(data: bytes, at: int):
+    (value, at) = _unpackString(data, at)
+    return (music21.dynamics.Dynamic(value), at)
+
+
+# Checked in order, so subclasses must come before their bases. Key
+# signatures come before the rest because music21.key.Key is one too.
+_encoders = [
+    (b"N", music21.note.Note, _encodeNote),
+    (b"K", music21.key.KeySignature, lambda k: struct.pack("<b", k.sharps)),
+    (b"T", music21.meter.TimeSignature, lambda t: _packString(t.ratioString)),
+    (b"M", music21.tempo.MetronomeMark, _encodeMetronome),
+    (b"C", music21.clef.Clef, lambda c: _packString(type(c).__name__)),
+    (b"I", music21.instrument.Instrument, _encodeInstrument),
+    (b"D", music21.dynamics.Dynamic, lambda d: _packString(d.value)),
+]
+
+_decoders: Dict[bytes, Callable] = {
+    b"N": _decodeNote,
+    b"K": _decodeKeySignature,
+    b"T": _decodeTimeSignature,
+    b"M": _decodeMetronome,
+    b"C": _decodeClef,
+    b"I": _decodeInstrument,
+    b"D": _decodeDynamic,
+}
+
+
+def _encodeElement(element) -> Tuple[bytes, bytes]:
+    for (tag, class_, encode) in _encoders:
+        if isinstance(element, class_):
+            return (tag, encode(element))
+    raise UnsupportedElement(type(element).__name__)
+
+
+def encodePart(part: music21.stream.Stream) -> bytes:
+    """
+    Encode the elements of a part.
+
+    Raises UnsupportedElement if the part holds anything other than the
+    elements listed at the top of this module.
+    """
+    elements = part.elements
+    encoded = [_header.pack(MAGIC, VERSION, len(elements))]
+    for element in elements:
+        (tag, payload) = _encodeElement(element)
+        encoded.append(_element.pack(tag, part.elementOffset(element)))
+        encoded.append(payload)
+    return b"".join(encoded)
+
+
+def decodePart(data: bytes) -> music21.stream.Stream:
+    """Decode a part encoded by encodePart."""
+    (magic, version, count) = _header.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded part")
+    if version > VERSION:
+        raise ValueError("Unknown part encoding version {}".format(version))
+
+    part = music21.stream.Stream()
+    at = _header.size
+    for _ in range(count):
+        (tag, offset) = _element.unpack_from(data, at)
+        (element, at) = _decoders[tag](data, at + _element.size)
+        part.coreInsert(offset, element)
+    part.coreElementsChanged()
+    return part
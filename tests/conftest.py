@@ -1 +1,33 @@
-"""Dummy docstring."""
+"""Fixtures shared between tests."""
+import music21
+import pytest
+
+from composte.util import musicFuns
+
+
+@pytest.fixture
+def make_part():
+    """
+    Build parts out of notes, under a key signature with sharps sharps.
+
+    Notes are either pitches, one per quarter note, or (offset, pitch,
+    length) tuples. Notes are inserted as they are, even if they overlap.
+    """
+
+    def make(notes=(), sharps=0):
+        part = music21.stream.Stream()
+        part.insert(0.0, music21.key.KeySignature(sharps))
+        for (i, note) in enumerate(notes):
+            if isinstance(note, str):
+                note = (float(i), note, 1.0)
+            (offset, pitch, length) = note
+            part.insert(offset, musicFuns.createNote(pitch, length))
+        return part
+
+    return make
+
+
+@pytest.fixture
+def names():
+    """Name the notes of parts, with their octaves."""
+    return lambda part: [note.nameWithOctave for note in part.notes]
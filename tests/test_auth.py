@@ -1,4 +1,5 @@
 """Test the auth helpers."""
+from composte.auth.auth import Hasher
 from composte.auth.auth import hash as h
 from composte.auth.auth import verify as v
 
@@ -15,3 +16,24 @@ def test_auth__hash_is_correct(mocker):
 def test_auth__hash_can_verify(mocker):
     known_hash = "$pbkdf2-sha256$29000$kPJ.LwUAIGQsZYyRci4FYA$7HIib0d2Df0mRVtxXkAcmOwhJEd.iirqlbVl.cV3uxQ"
     assert v("m", known_hash)
+
+
+def test_auth__hasher_hashes_in_another_process():
+    hasher = Hasher(workers=1)
+    try:
+        record = hasher.hash("m")
+        assert hasher.verify("m", record)
+        assert not hasher.verify("n", record)
+    finally:
+        hasher.shutdown()
+
+
+def test_auth__hasher_tracks_jobs(mocker):
+    mocker.patch("composte.auth.auth.pbkdf2_sha256.hash", return_value="record")
+    hasher = Hasher(workers=0)
+    assert hasher.hash("m") == "record"
+
+    stats = hasher.stats()
+    assert stats["jobs"] == 1
+    assert stats["pending"] == 0
+    assert stats["max_pending"] == 1
@@ -0,0 +1,137 @@
+"""Test the bookkeeping helpers."""
+from composte.util.bookkeeping import LockPool, ProjectPool
+
+
+def test_lock_pool__same_tag_same_lock():
+    locks = LockPool()
+    assert locks.get("a") is locks.get("a")
+
+
+def test_lock_pool__different_tags_different_locks():
+    locks = LockPool()
+    assert locks.get("a") is not locks.get("b")
+
+
+def test_lock_pool__locks_are_reentrant():
+    locks = LockPool()
+    with locks.get("a"):
+        with locks.get("a"):
+            pass
+
+
+def test_project_pool__only_dirty_projects_are_visited():
+    pool = ProjectPool()
+    pool.put("dirty-1", lambda: "dirty project")
+    pool.put("clean-1", lambda: "clean project")
+    pool.mark_dirty("dirty-1")
+
+    visited = []
+    pool.map_dirty(lambda proj, count: visited.append(proj))
+    assert visited == ["dirty project"]
+
+    pool.mark_clean("dirty-1")
+    visited.clear()
+    pool.map_dirty(lambda proj, count: visited.append(proj))
+    assert visited == []
+
+
+def test_project_pool__young_dirty_projects_are_skipped():
+    pool = ProjectPool()
+    pool.put("dirty-2", lambda: "dirty project")
+    pool.mark_dirty("dirty-2")
+
+    visited = []
+    pool.map_dirty(lambda proj, count: visited.append(proj), max_age=60)
+    assert visited == []
+    assert pool.is_dirty("dirty-2")
+
+
+def test_project_pool__evicts_least_recently_used_unused_projects():
+    pool = ProjectPool(max_projects=2)
+    for pid in ["a", "b"]:
+        pool.put(pid, lambda: pid)
+        pool.remove(pid)
+    # Touch a, so b is the least recently used
+    pool.put("a")
+    pool.remove("a")
+
+    pool.put("c", lambda: "c")
+    assert pool.put("b") is None
+    assert pool.put("a") == "a"
+    assert pool.stats()["evictions"] == 1
+
+
+def test_project_pool__projects_in_use_are_never_evicted():
+    pool = ProjectPool(max_projects=1)
+    pool.put("a", lambda: "a")
+    pool.put("b", lambda: "b")
+    assert pool.put("a") == "a"
+    assert pool.stats()["evictions"] == 0
+
+
+def test_project_pool__dirty_projects_are_flushed_before_eviction():
+    pool = ProjectPool(max_projects=1)
+    pool.put("a", lambda: "a")
+    pool.mark_dirty("a")
+    pool.remove("a")
+    pool.put("b", lambda: "b")
+    pool.remove("b")
+    assert pool.stats()["projects"] == 2
+
+    flushed = []
+
+    def flush(proj, count):
+        flushed.append(proj)
+        pool.mark_clean(proj)
+
+    pool.evict(flush)
+    assert flushed == ["a"]
+    assert pool.stats()["projects"] == 1
+    assert pool.put("a") is None
+
+
+def test_project_pool__last_reference_runs_on_removal():
+    pool = ProjectPool()
+    pool.put("a", lambda: "a")
+    pool.put("a")
+
+    removed = []
+    assert pool.remove("a", removed.append) == 1
+    assert removed == []
+    assert pool.remove("a", removed.append) == 0
+    assert removed == ["a"]
+    assert pool.stats()["hits"] == 1
+
+
+def test_project_pool__failed_loads_are_not_cached():
+    pool = ProjectPool(max_bytes=10, sizeof=len)
+    assert pool.put("missing", lambda: None) is None
+    assert pool.stats()["projects"] == 0
+
+    assert pool.put("a", lambda: "a") == "a"
+    pool.remove("a")
+    assert pool.put("missing", lambda: "found") == "found"
+
+
+def test_project_pool__byte_budget_follows_projects_as_they_grow():
+    measured = []
+
+    def sizeof(proj):
+        measured.append(proj)
+        return len(proj)
+
+    pool = ProjectPool(max_bytes=4, sizeof=sizeof)
+    for pid in ["a", "b", "c"]:
+        pool.put(pid, lambda: [pid])
+        pool.remove(pid)
+    assert pool.stats()["projects"] == 3
+
+    grown = pool.put("c")
+    grown.extend(["more", "notes"])
+    pool.remove("c")
+    pool.put("d", lambda: ["d"])
+    assert pool.put("a") is None
+    assert pool.put("b") is None
+    assert pool.stats()["evictions"] == 2
+    # Each project is measured on the way in and on the way out, no more
+    assert len(measured) == 8
@@ -0,0 +1,34 @@
+"""Test the wire encodings of messages."""
+import pytest
+
+from composte.protocol import codec
+
+
+def test_codec__messages_are_told_apart_by_their_first_byte():
+    message = {"fName": "update", "args": ["p", "insertNote", [0.0, 0, "C4", 1.0]]}
+    for name in codec.available():
+        encoded = codec.encode(message, name)
+        assert codec.detect(encoded) == name
+        assert codec.decode(encoded) == message
+    assert codec.detect(codec.encode(message, codec.JSON).encode()) == codec.JSON
+
+
+def test_codec__negotiation_falls_back_to_json():
+    assert codec.negotiate(codec.available()) == codec.available()[0]
+    assert codec.negotiate(["carrier pigeon"]) == codec.JSON
+    assert codec.negotiate([]) == codec.JSON
+
+
+def test_codec__legacy_arguments_are_strings():
+    assert codec.legacyArgument(None) == "None"
+    assert codec.legacyArgument(1.5) == "1.5"
+    assert codec.legacyArgument((0.0, 0, "C4")) == '[0.0, 0, "C4"]'
+
+
+def test_codec__plain_text_is_not_msgpack():
+    failure = b"Failure (Internal Server Error): update"
+    assert codec.detect(failure) == codec.JSON
+    assert codec.detect(b"") == codec.JSON
+    for message in (failure, b""):
+        with pytest.raises(ValueError):
+            codec.decode(message)
@@ -0,0 +1,61 @@
+"""Test Composte projects."""
+import json
+
+import music21
+
+from composte.util.composteProject import ComposteProject, deserializeProject
+
+
+def make_project(nparts):
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    for i in range(1, nparts):
+        part = music21.stream.Stream()
+        part.insert(0.0, music21.note.Note("C{}".format(i)))
+        project.parts.append(part)
+    return project
+
+
+def test_composteProject__parts_thaw_on_first_use():
+    project = deserializeProject(make_project(3).serialize())
+    assert not any(project.parts.isThawed(i) for i in range(3))
+
+    assert project.parts[1].notes[0].nameWithOctave == "C1"
+    assert [project.parts.isThawed(i) for i in range(3)] == [False, True, False]
+
+
+def test_composteProject__untouched_parts_serialize_unchanged():
+    serialized = make_project(3).serialize()
+    project = deserializeProject(serialized)
+    project.parts[2].insert(1.0, music21.note.Note("D4"))
+    project.parts.markChanged(2)
+
+    before = json.loads(serialized[1])
+    after = json.loads(project.serialize()[1])
+    assert after[:2] == before[:2]
+    assert after[2] != before[2]
+    assert len(deserializeProject(project.serialize()).parts[2].notes) == 2
+
+
+def test_composteProject__swap_and_remove_leave_parts_frozen():
+    project = deserializeProject(make_project(3).serialize())
+    project.swapParts(0, 2)
+    project.removePart(1)
+    assert not any(project.parts.isThawed(i) for i in range(2))
+    assert project.parts[0].notes[0].nameWithOctave == "C2"
+
+
+def test_composteProject__only_changed_parts_need_storing():
+    project = deserializeProject(make_project(3).serialize(), ["a", "b", "c"])
+    project.parts[0]
+    project.parts.markChanged(1)
+    project.parts.swap(1, 2)
+    project.addPart()
+    assert project.parts.storedNames() == ["a", "c", None, None]
+
+
+def test_composteProject__parts_never_thawed_are_never_changed():
+    project = deserializeProject(make_project(3).serialize(), ["a", "b", "c"])
+    project.parts[1]
+    project.parts.markChanged()
+    assert project.parts.storedNames() == ["a", None, "c"]
+    assert not project.parts.isThawed(0)
@@ -0,0 +1,114 @@
+"""Test the database driver."""
+import sqlite3
+from threading import Thread
+
+import pytest
+
+from composte.db import driver
+
+
+def test_driver__connections_are_per_thread_and_use_wal(tmp_path):
+    db = driver.ConnectionManager(str(tmp_path / "test.db"))
+    assert db.connection() is db.connection()
+    assert db.fetchone("PRAGMA journal_mode") == ("wal",)
+
+    others = []
+    thread = Thread(target=lambda: others.append(db.connection()))
+    thread.start()
+    thread.join()
+    assert others[0] is not db.connection()
+    db.close()
+
+
+def test_driver__failed_writes_are_rolled_back(tmp_path):
+    db = driver.ConnectionManager(str(tmp_path / "test.db"))
+    db.execute("CREATE TABLE t (x INTEGER PRIMARY KEY)")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.writing() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            conn.execute("INSERT INTO t VALUES (1)")
+    assert db.fetchall("SELECT x FROM t") == []
+    db.close()
+
+
+def test_driver__tables_share_writes_across_threads(tmp_path):
+    dbname = str(tmp_path / "test.db")
+    (users, projects, contributors) = (
+        driver.Auth(dbname),
+        driver.Projects(dbname),
+        driver.Contributors(dbname),
+    )
+
+    def register(name):
+        users.put(name, "hash")
+        projects.put(name + "-project", "song", name)
+        contributors.put(name, name + "-project")
+
+    threads = [Thread(target=register, args=(str(i),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert users.get("3").hash == "hash"
+    assert [p.id for p in contributors.get(username="5")] == ["5-project"]
+    driver.get_manager(dbname).close()
+
+
+def test_driver__cache_expires_and_counts_hits():
+    cache = driver.ReadCache(ttl=60)
+    lookups = []
+    assert cache.get("k", lambda: lookups.append(1) or "v") == "v"
+    assert cache.get("k", lambda: lookups.append(1) or "w") == "v"
+    assert len(lookups) == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+    expired = driver.ReadCache(ttl=0)
+    expired.get("k", lambda: "v")
+    assert expired.get("k", lambda: "w") == "w"
+
+
+def test_driver__puts_invalidate_cached_lookups(tmp_path):
+    dbname = str(tmp_path / "test.db")
+    (users, projects, contributors) = (
+        driver.Auth(dbname),
+        driver.Projects(dbname),
+        driver.Contributors(dbname),
+    )
+
+    assert users.get("alice").uname is None
+    users.put("alice", "hash")
+    users.put("bob", "hash")
+    assert users.get("alice").uname == "alice"
+
+    projects.put("p", "song", "alice")
+    contributors.put("alice", "p")
+    assert contributors.is_contributor("alice", "p")
+    assert not contributors.is_contributor("bob", "p")
+    contributors.put("bob", "p")
+    assert contributors.is_contributor("bob", "p")
+    assert [u.uname for u in contributors.get(project_id="p")] == ["alice", "bob"]
+    assert [p.id for p in contributors.get(username="bob")] == ["p"]
+
+    assert contributors.cache_stats()["hits"] == 2
+    driver.get_manager(dbname).close()
+
+
+def test_driver__migrations_upgrade_old_databases_once(tmp_path):
+    dbname = str(tmp_path / "test.db")
+    conn = sqlite3.connect(dbname)
+    conn.executescript(driver.MIGRATIONS[0][1] + ";" + driver.MIGRATIONS[0][2])
+    conn.close()
+
+    db = driver.ConnectionManager(dbname)
+    assert db.migrate() == len(driver.MIGRATIONS)
+    assert db.migrate() == len(driver.MIGRATIONS)
+    assert db.fetchone("PRAGMA user_version") == (len(driver.MIGRATIONS),)
+
+    plan = db.fetchall(
+        "EXPLAIN QUERY PLAN SELECT username FROM contributors WHERE project_id=?",
+        ("p",),
+    )
+    assert "contributors_by_project" in str(plan)
+    db.close()
@@ -0,0 +1,34 @@
+"""Test the manipulations on music21 objects."""
+import music21
+
+from composte.util import musicFuns
+
+
+def test_musicFuns__key_change_respells_following_notes(make_part, names):
+    part = make_part(["C4", "C#4", "D-4", "A-4", "B#3"])
+    assert musicFuns.changeKeySignature(2.0, part, -2) == [2.0, 5.0]
+    assert names(part) == ["C4", "C#4", "D-4", "A-4", "C4"]
+
+
+def test_musicFuns__key_change_stops_at_next_key_signature(make_part, names):
+    part = make_part(["D-4", "D-4", "D-4", "D-4"])
+    musicFuns.changeKeySignature(2.5, part, -1)
+    assert musicFuns.changeKeySignature(0.0, part, 2) == [0.0, 2.5]
+    assert names(part) == ["C#4", "C#4", "C#4", "D-4"]
+
+
+def test_musicFuns__insert_replaces_overlapping_notes(make_part, names):
+    part = make_part(["C4", "D4", "E4"])
+    assert musicFuns.insertNote(0.5, part, "G4", 1.0) == [0.0, 2.0]
+    assert names(part) == ["G4", "E4"]
+
+
+def test_musicFuns__bounded_offset_includes_elements_starting_in_bounds(make_part):
+    part = make_part(["C4", "D4", "E4"])
+    part.insert(1.0, music21.clef.BassClef())
+    bounded = musicFuns.boundedOffset(part, (1.0, 2.0))
+    assert [(om.offset, type(om.element).__name__) for om in bounded] == [
+        (1.0, "BassClef"),
+        (1.0, "Note"),
+    ]
+    assert bounded[1].endTime == 2.0
@@ -0,0 +1,56 @@
+"""Test the wrapper around the music functions."""
+import json
+
+import pytest
+
+from composte.network.base.exceptions import GenericError
+from composte.util import musicWrapper
+from composte.util.composteProject import ComposteProject, deserializeProject
+
+
+def perform(project, fname, args, partIndex="0", offset="0.0"):
+    return musicWrapper.performMusicFun(
+        str(project.project_id),
+        fname,
+        json.dumps(args),
+        partIndex,
+        offset,
+        fetchProject=lambda _: project,
+    )
+
+
+def test_musicWrapper__inserts_notes():
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    assert perform(project, "insertNote", [1.0, 0, "C4", 1.0]) == ("ok", [1.0, 2.0])
+    assert [note.nameWithOctave for note in project.parts[0].notes] == ["C4"]
+
+
+def test_musicWrapper__only_converts_arguments_it_needs():
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    # Plenty of other functions would choke on "C4" as args[2], or on the
+    # missing args[3]
+    assert perform(project, "removeNote", [1.0, "whatever", "C4"]) == ("ok", [1.0, 1.0])
+
+
+def test_musicWrapper__rejects_unknown_functions():
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    assert perform(project, "frobnicate", []) == ("fail", "INVALID OPERATION")
+
+
+def test_musicWrapper__rejects_malformed_arguments():
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    with pytest.raises(GenericError):
+        perform(project, "insertNote", ["one", 0, "C4", 1.0])
+    with pytest.raises(GenericError):
+        perform(project, "insertNote", [1.0])
+
+
+def test_musicWrapper__edits_leave_other_parts_stored():
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    project.addPart()
+    project.addPart()
+    project = deserializeProject(project.serialize(), ["a", "b", "c"])
+
+    perform(project, "insertNote", [1.0, 0, "C4", 1.0], partIndex="1")
+    assert project.parts.storedNames() == ["a", None, "c"]
+    assert not project.parts.isThawed(0)
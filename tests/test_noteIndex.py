@@ -0,0 +1,37 @@
+"""Test the index of the notes in a part."""
+import music21
+
+from composte.util import noteIndex
+
+
+def test_noteIndex__finds_notes_by_offset_and_pitch(make_part):
+    index = noteIndex.NoteIndex(make_part([(0.0, "C4", 1.0), (0.0, "E4", 1.0)]))
+    assert len(index) == 2
+    assert index.find(0.0, "E4").nameWithOctave == "E4"
+    assert index.find(0.0, "G4") is None
+    assert index.find(1.0, "C4") is None
+    assert [note.nameWithOctave for note in index.at(0.0)] == ["C4", "E4"]
+
+
+def test_noteIndex__finds_overlapping_notes(make_part):
+    part = make_part([(0.0, "C4", 4.0), (4.0, "D4", 1.0), (6.0, "E4", 1.0)])
+    index = noteIndex.NoteIndex(part)
+    assert [note.nameWithOctave for note in index.overlapping(3.0, 5.0)] == ["C4", "D4"]
+    assert index.overlapping(5.0, 6.0) == []
+    assert [note.nameWithOctave for note in index.overlapping(6.5, 7.0)] == ["E4"]
+
+
+def test_noteIndex__tracks_additions_and_removals():
+    index = noteIndex.NoteIndex()
+    note = music21.note.Note("C4")
+    index.add(note, 2.0)
+    assert index.at(2.0) == [note]
+    index.remove(note, 2.0)
+    assert len(index) == 0
+
+
+def test_noteIndex__one_index_per_part(make_part):
+    part = make_part([(0.0, "C4", 1.0)])
+    index = noteIndex.forPart(part)
+    assert noteIndex.forPart(part) is index
+    assert noteIndex.forPart(make_part([(0.0, "C4", 1.0)])) is not index
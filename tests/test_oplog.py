@@ -0,0 +1,61 @@
+"""Test the operation log."""
+from composte.util.oplog import OperationLog
+
+
+def test_oplog__read_returns_operations_after_version(tmp_path):
+    log = OperationLog(str(tmp_path))
+    log.append("p", 1, ["insertNote", '[0.0, 0, "C4", 1.0]', "0", "0.0"])
+    log.append("p", 2, ["removeNote", '[0.0, 0, "C4"]', "0", "0.0"])
+    log.sync()
+
+    assert [version for (version, op) in log.read("p")] == [1, 2]
+    assert log.read("p", since=1) == [(2, ["removeNote", '[0.0, 0, "C4"]', "0", "0.0"])]
+    assert log.read("somebody else") == []
+
+
+def test_oplog__compact_drops_snapshotted_operations(tmp_path):
+    log = OperationLog(str(tmp_path), retain=0)
+    for version in range(1, 4):
+        log.append("p", version, ["chat", "[]", "None", "None"])
+
+    log.compact("p", 2)
+    assert [version for (version, op) in log.read("p")] == [3]
+
+    # The log keeps working after being compacted
+    log.append("p", 4, ["chat", "[]", "None", "None"])
+    log.compact("p", 4)
+    assert log.read("p") == []
+
+
+def test_oplog__torn_final_line_is_ignored(tmp_path):
+    log = OperationLog(str(tmp_path))
+    log.append("p", 1, ["chat", "[]", "None", "None"])
+    log.close()
+    with open(tmp_path / "p.log", "a") as f:
+        f.write('{"version": 2, "op": ["ch')
+
+    assert [version for (version, op) in log.read("p")] == [1]
+
+
+def test_oplog__appends_after_a_torn_line_survive(tmp_path):
+    log = OperationLog(str(tmp_path))
+    log.append("p", 1, ["a"])
+    log.close()
+    with open(tmp_path / "p.log", "a") as f:
+        f.write('{"version": 2, "op": ["ch')
+
+    log = OperationLog(str(tmp_path))
+    log.append("p", 2, ["b"])
+    log.append("p", 3, ["c"])
+    log.sync()
+    assert log.read("p") == [(1, ["a"]), (2, ["b"]), (3, ["c"])]
+
+
+def test_oplog__compact_retains_recent_history(tmp_path):
+    log = OperationLog(str(tmp_path), retain=2)
+    for version in range(1, 6):
+        log.append("p", version, ["chat", "[]", "None", "None"])
+
+    log.compact("p", 4)
+    assert [version for (version, op) in log.read("p")] == [3, 4, 5]
+    assert [version for (version, op) in log.read("p", since=4)] == [5]
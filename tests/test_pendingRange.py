@@ -0,0 +1,33 @@
+"""Test the coalescing of pending ranges."""
+from composte.util.pendingRange import PendingRange
+
+
+def test_pendingRange__nothing_pending_at_first():
+    pending = PendingRange()
+    assert pending.take() is None
+
+
+def test_pendingRange__only_the_first_addition_starts_a_range():
+    pending = PendingRange()
+    assert pending.add(2.0, 3.0)
+    assert not pending.add(0.0, 1.0)
+    assert not pending.add(4.0, 5.0)
+    assert pending.stats() == {"added": 3, "started": 1}
+
+
+def test_pendingRange__additions_are_merged_until_taken():
+    pending = PendingRange()
+    pending.add(2.0, 3.0)
+    pending.add(0.0, 1.0)
+    pending.add(2.5, 5.0)
+    assert pending.take() == (0.0, 5.0)
+    assert pending.take() is None
+
+
+def test_pendingRange__taking_starts_a_new_range():
+    pending = PendingRange()
+    pending.add(0.0, 8.0)
+    pending.take()
+    assert pending.add(1.0, 2.0)
+    assert pending.take() == (1.0, 2.0)
+    assert pending.stats() == {"added": 2, "started": 2}
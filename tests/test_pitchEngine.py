@@ -0,0 +1,72 @@
+"""Test the bulk pitch operations."""
+import music21
+import pytest
+
+from composte.util import musicFuns, pitchEngine
+
+
+def test_pitchEngine__transposes_in_place(make_part, names):
+    part = make_part(["C4", "E4", "B4"], sharps=2)
+    notes = list(part.notes)
+    assert pitchEngine.transpose(part, 1) == [0.0, 3.0]
+    assert names(part) == ["C#4", "F4", "C5"]
+    assert list(part.notes) == notes
+
+
+def test_pitchEngine__transposes_a_range(make_part, names):
+    part = make_part(["C4", "C4", "C4", "C4"])
+    assert pitchEngine.transpose(part, -1, 1.0, 2.0) == [1.0, 3.0]
+    assert names(part) == ["C4", "B3", "B3", "C4"]
+
+
+def test_pitchEngine__spells_by_key_signature_in_effect(make_part, names):
+    part = make_part(["C4", "C4", "C4"])
+    part.insert(1.5, music21.key.KeySignature(3))
+    pitchEngine.transpose(part, 3)
+    assert names(part) == ["E-4", "E-4", "D#4"]
+
+
+def test_pitchEngine__refuses_to_leave_midi_range(make_part, names):
+    part = make_part(["C9"])
+    with pytest.raises(music21.Music21Exception):
+        pitchEngine.transpose(part, 12)
+    assert names(part) == ["C9"]
+
+
+def test_pitchEngine__respells_against_key(make_part, names):
+    part = make_part(["C#4", "D-4", "E4"])
+    pitchEngine.respell(list(part.notes), hasSharps=False)
+    assert names(part) == ["D-4", "D-4", "E4"]
+
+
+def test_pitchEngine__transposes_through_musicFuns(make_part, names):
+    part = make_part(["C4"])
+    assert musicFuns.transpose(part, 2) == [0.0, 1.0]
+    assert names(part) == ["D4"]
+
+
+def test_pitchEngine__whole_steps_in_c_major_keep_sharps(make_part, names):
+    part = make_part(["E4", "F#4", "B-4"])
+    musicFuns.transpose(part, 2)
+    assert names(part) == ["F#4", "G#4", "C5"]
+
+
+def test_pitchEngine__spells_with_sharps_in_sharp_keys(make_part, names):
+    part = make_part(["A4", "D4", "E-4", "E#4"], sharps=1)
+    pitchEngine.transpose(part, 1)
+    assert names(part) == ["A#4", "D#4", "E4", "F#4"]
+
+
+def test_pitchEngine__spells_with_flats_in_flat_keys(make_part, names):
+    part = make_part(["A4", "C#4"], sharps=-1)
+    pitchEngine.transpose(part, 1)
+    assert names(part) == ["B-4", "D4"]
+
+
+def test_pitchEngine__octaves_keep_their_spelling(make_part, names):
+    for sharps in (-3, 0, 3):
+        part = make_part(["D-4", "C#4", "E#4", "B#3"], sharps=sharps)
+        pitchEngine.transpose(part, 12)
+        assert names(part) == ["D-5", "C#5", "E#5", "B#4"]
+        pitchEngine.transpose(part, -24)
+        assert names(part) == ["D-3", "C#3", "E#3", "B#2"]
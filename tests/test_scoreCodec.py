@@ -0,0 +1,67 @@
+"""Test the compact encoding of parts."""
+import music21
+import pytest
+
+from composte.util import scoreCodec
+
+
+def describe(part):
+    described = []
+    for element in part.elements:
+        described.append(
+            (
+                part.elementOffset(element),
+                type(element).__name__,
+                getattr(element, "nameWithOctave", None),
+                getattr(element, "quarterLength", None),
+                getattr(element, "tiePartners", None),
+                getattr(getattr(element, "tie", None), "type", None),
+                getattr(element, "lyric", None),
+                getattr(element, "sharps", None),
+                getattr(element, "ratioString", None),
+                getattr(element, "number", None),
+                getattr(element, "instrumentName", None),
+                getattr(element, "value", None),
+            )
+        )
+    return described
+
+
+@pytest.fixture
+def part(make_part):
+    notes = [(0.0, "C4", 0.5), (1.0, "E-4", 1.5), (2.0, "G#5", 2.5), (3.0, "B-2", 3.5)]
+    part = make_part(notes, sharps=-2)
+    part.insert(0.0, music21.meter.TimeSignature("3/4"))
+    part.insert(0.0, music21.tempo.MetronomeMark("", 96, 1.0))
+    part.insert(0.0, music21.clef.clefFromString("bass"))
+    part.insert(0.0, music21.instrument.fromString("violin"))
+    part.insert(1.0, music21.dynamics.Dynamic("mp"))
+
+    (first, second) = list(part.notes)[:2]
+    first.tie = music21.tie.Tie("start")
+    second.tie = music21.tie.Tie("stop")
+    first.tiePartners[1] = second.offset
+    second.tiePartners[0] = first.offset
+    second.addLyric("la")
+    return part
+
+
+def test_scoreCodec__round_trips_like_pickle(part):
+    pickled = music21.converter.thawStr(music21.converter.freezeStr(part))
+    encoded = scoreCodec.decodePart(scoreCodec.encodePart(part))
+    assert describe(encoded) == describe(pickled) == describe(part)
+
+
+def test_scoreCodec__is_smaller_than_pickle(part):
+    assert len(scoreCodec.encodePart(part)) < len(music21.converter.freezeStr(part))
+
+
+def test_scoreCodec__detects_its_own_format(part):
+    assert scoreCodec.isEncoded(scoreCodec.encodePart(part))
+    assert not scoreCodec.isEncoded(music21.converter.freezeStr(part))
+
+
+def test_scoreCodec__refuses_unsupported_elements(part):
+    part.insert(0.0, music21.note.Rest())
+    with pytest.raises(scoreCodec.UnsupportedElement):
+        scoreCodec.encodePart(part)
@@ -0,0 +1,65 @@
+"""Test the project storage backends."""
+import music21
+import pytest
+
+from composte.db import driver, storage
+from composte.util.composteProject import ComposteProject
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, tmp_path):
+    dbname = str(tmp_path / "composte.db")
+    driver.Auth(dbname).put("alice", "hash")
+    projects = driver.Projects(dbname)
+    if request.param == "file":
+        yield (storage.FileStorage(str(tmp_path / "users"), projects), projects)
+    else:
+        yield (storage.SQLiteStorage(dbname), projects)
+    driver.get_manager(dbname).close()
+
+
+def make_project(projects, nparts):
+    project = ComposteProject({"name": "song", "owner": "alice"})
+    projects.put(str(project.project_id), "song", "alice")
+    for i in range(1, nparts):
+        part = music21.stream.Stream()
+        part.insert(0.0, music21.note.Note("C{}".format(i)))
+        project.parts.append(part)
+    return project
+
+
+def test_storage__snapshots_read_back(backend):
+    (store, projects) = backend
+    (first, second) = (make_project(projects, 2), make_project(projects, 3))
+    second.version = 7
+    store.write([first, second])
+
+    project = store.read(str(second.project_id))
+    assert project.version == 7
+    assert project.metadata["owner"] == "alice"
+    assert [len(part.notes) for part in project.parts] == [0, 1, 1]
+    assert project.parts.storedNames() == second.parts.storedNames()
+
+
+def test_storage__only_changed_parts_are_rewritten(backend):
+    (store, projects) = backend
+    project = make_project(projects, 3)
+    store.write([project])
+    before = project.parts.storedNames()
+
+    project.parts[2].insert(1.0, music21.note.Note("D4"))
+    project.parts.markChanged(2)
+    store.write([project])
+    after = project.parts.storedNames()
+
+    assert after[:2] == before[:2]
+    assert after[2] not in before
+    assert len(store.read(str(project.project_id)).parts[2].notes) == 2
+
+
+def test_storage__sqlite_schema_is_versioned(tmp_path):
+    dbname = str(tmp_path / "composte.db")
+    storage.SQLiteStorage(dbname)
+    db = driver.get_manager(dbname)
+    assert db.fetchone("PRAGMA user_version") == (len(driver.MIGRATIONS),)
+    db.close()